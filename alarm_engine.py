@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Alarmregeln direkt in der Abfrageschleife
+
+Regeln werden einmal beim Start kompiliert und gegen jeden frischen Snapshot
+ausgewertet (Echtzeit, Statistik, abgeleitete Werte und die zuletzt gelesenen
+Einstellungen, also ohne zusaetzliche Abfragen am Geraet). Ereignisse gehen
+sofort an {DEVICE_ID}/event, die aktiven Alarme stehen retained unter
+{DEVICE_ID}/alarms.
+
+Regel (alarms.json, ALARM_RULES; siehe alarms.example.json):
+    "bat_near_lvd": {
+        "when": "bat_voltage < low_volt_disconnect + 0.3 for 30s",
+        "hysteresis": 0.2,          # erst wieder aus ab low_volt_disconnect + 0.5
+        "clear_for": 60,            # ... und das 60 s lang (Entprellen)
+        "severity": "warning",
+        "message": "Batterie {bat_voltage} V nahe LVD {low_volt_disconnect} V",
+        "clear_message": "Batterie wieder {bat_voltage} V"
+    }
+
+Ausdruecke: Feldnamen, Zahlen, + - * /, Vergleiche, and/or/not. Statt
+"hysteresis" kann "clear" eine eigene Bedingung zum Beenden angeben. Eine
+Regel als null schaltet eine eingebaute Regel ab.
+
+    python alarm_engine.py              # Regeln anzeigen
+    python alarm_engine.py --check      # gegen den aktuellen Poller-Snapshot pruefen
+"""
+
+import os
+import re
+import ast
+import json
+import time
+import argparse
+from datetime import datetime
+
+from metrics import Counter, Gauge
+
+ALARM_RULES = os.environ.get('ALARM_RULES',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alarms.json'))
+
+ALARM_ACTIVE = Gauge("epever_alarm_active", "Alarm aktiv (1/0)", ["rule"])
+ALARM_EVENTS = Counter("epever_alarm_events_total", "Alarm-Ereignisse (raised/cleared)", ["rule", "event"])
+
+# Eingebaute Regeln, alarms.json ergaenzt oder ueberschreibt sie
+RULES = {
+    "bat_near_lvd": {
+        "when": "bat_voltage < low_volt_disconnect + 0.3 for 30s",
+        "hysteresis": 0.2,
+        "clear_for": 60,
+        "severity": "warning",
+        "message": "Batterie {bat_voltage} V nahe Tiefentladeschutz ({low_volt_disconnect} V)",
+    },
+    "bat_under_volt": {
+        "when": "bat_voltage < under_volt_warning for 30s",
+        "hysteresis": 0.2,
+        "severity": "warning",
+        "message": "Batterie {bat_voltage} V unter Warnschwelle ({under_volt_warning} V)",
+    },
+    "dev_overtemp": {
+        "when": "dev_temp > 60 for 60s",
+        "hysteresis": 5,
+        "severity": "critical",
+        "message": "Geraetetemperatur {dev_temp} °C",
+    },
+    "bat_overtemp": {
+        "when": "bat_temp > 45 for 60s",
+        "hysteresis": 3,
+        "severity": "critical",
+        "message": "Batterietemperatur {bat_temp} °C",
+    },
+}
+
+DURATION_UNITS = {"s": 1, "m": 60, "min": 60, "h": 3600}
+DURATION = re.compile(r"^(.*?)\s+for\s+(\d+(?:\.\d+)?)\s*(s|min|m|h)?\s*$")
+
+ALLOWED_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.USub, ast.UAdd, ast.Not,
+                 ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+                 ast.Eq, ast.NotEq, ast.Name, ast.Load, ast.Constant)
+
+# Vergleich -> Richtung, in die die Hysterese die Grenze fuer "noch aktiv" verschiebt
+HOLD_DIRECTION = {ast.Lt: 1, ast.LtE: 1, ast.Gt: -1, ast.GtE: -1}
+
+
+def compile_expression(text, rule):
+    """Ausdruck -> (Code, benutzte Felder); nur Arithmetik, Vergleiche und Feldnamen"""
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError:
+        raise ValueError(f"Alarmregel {rule}: ungueltiger Ausdruck {text!r}")
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f"Alarmregel {rule}: {type(node).__name__} nicht erlaubt in {text!r}")
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+    return compile(tree, f"<alarm {rule}>", "eval"), names
+
+
+def _evaluator(node, rule):
+    code, _ = compile_expression(ast.unparse(node), rule)
+    return code
+
+
+class AlarmRule:
+    def __init__(self, name, spec):
+        if isinstance(spec, str):
+            spec = {"when": spec}
+        self.name = name
+        self.severity = spec.get("severity", "warning")
+        self.message = spec.get("message", name)
+        self.clear_message = spec.get("clear_message", self.message)
+        when = spec["when"]
+        match = DURATION.match(when)
+        self.delay = float(spec.get("for", 0))
+        if match:
+            when = match.group(1)
+            self.delay = float(match.group(2)) * DURATION_UNITS[match.group(3) or "s"]
+        self.clear_delay = float(spec.get("clear_for", 0))
+        self.expression = when
+        self.code, self.names = compile_expression(when, name)
+        tree = ast.parse(when, mode="eval").body
+        # Einfacher Vergleich: beide Seiten getrennt, fuer Hysterese und den gemeldeten Wert/Grenzwert
+        self.sides = None
+        if isinstance(tree, ast.Compare) and len(tree.ops) == 1:
+            self.sides = (_evaluator(tree.left, name), _evaluator(tree.comparators[0], name), type(tree.ops[0]))
+        self.clear = None
+        self.hysteresis = float(spec.get("hysteresis", 0))
+        if "clear" in spec:
+            self.clear, clear_names = compile_expression(spec["clear"], name)
+            self.names |= clear_names
+        elif self.hysteresis and (self.sides is None or self.sides[2] not in HOLD_DIRECTION):
+            raise ValueError(f"Alarmregel {name}: Hysterese nur bei einem Vergleich mit < <= > >=")
+        self.active = False
+        self.pending_since = None
+        self.clear_since = None
+
+    def sides_of(self, values):
+        if self.sides is None:
+            return None, None
+        return eval(self.sides[0], {"__builtins__": {}}, values), eval(self.sides[1], {"__builtins__": {}}, values)
+
+    def holds(self, values):
+        # Bedingung fuer "bleibt aktiv": eigene clear-Bedingung oder um die Hysterese verschobene Grenze
+        if self.clear is not None:
+            return not eval(self.clear, {"__builtins__": {}}, values)
+        if not self.hysteresis:
+            return eval(self.code, {"__builtins__": {}}, values)
+        value, limit = self.sides_of(values)
+        direction = HOLD_DIRECTION[self.sides[2]]
+        limit += direction * self.hysteresis
+        return value < limit if direction > 0 else value > limit
+
+    def update(self, values, now):
+        """Neuer Snapshot; liefert "raised", "cleared" oder None"""
+        if not self.names.issubset(values):
+            return None
+        try:
+            if not self.active:
+                if not eval(self.code, {"__builtins__": {}}, values):
+                    self.pending_since = None
+                    return None
+                if self.pending_since is None:
+                    self.pending_since = now
+                if now - self.pending_since < self.delay:
+                    return None
+                self.active, self.clear_since = True, None
+                return "raised"
+            if self.holds(values):
+                self.clear_since = None
+                return None
+        except (TypeError, ZeroDivisionError):
+            # Feld ohne Zahlenwert (z.B. "Unbekannt(7)"): Regel in diesem Zyklus auslassen
+            return None
+        if self.clear_since is None:
+            self.clear_since = now
+        if now - self.clear_since < self.clear_delay:
+            return None
+        self.active, self.pending_since = False, None
+        return "cleared"
+
+    def describe(self):
+        text = self.expression + (f" fuer {self.delay:g}s" if self.delay else "")
+        if self.hysteresis:
+            text += f", Hysterese {self.hysteresis:g}"
+        if self.clear is not None:
+            text += ", eigene Aufhebung"
+        return text
+
+
+def load_rules(path=ALARM_RULES):
+    rules = dict(RULES)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            rules.update(json.load(f))
+    return [AlarmRule(name, spec) for name, spec in rules.items() if spec]
+
+
+class AlarmEngine:
+    def __init__(self, rules=None):
+        self.rules = load_rules() if rules is None else rules
+
+    def evaluate(self, values, now=None, ts=None):
+        """Snapshot-Werte auswerten; liefert die Ereignisse dieses Zyklus"""
+        now = time.monotonic() if now is None else now
+        ts = datetime.now() if ts is None else ts
+        events = []
+        for rule in self.rules:
+            event = rule.update(values, now)
+            if event is None:
+                continue
+            ALARM_ACTIVE.set(1 if rule.active else 0, rule=rule.name)
+            ALARM_EVENTS.inc(rule=rule.name, event=event)
+            value, limit = rule.sides_of(values) if rule.sides else (None, None)
+            try:
+                message = (rule.message if event == "raised" else rule.clear_message).format_map(values)
+            except (KeyError, ValueError, IndexError):
+                message = rule.message if event == "raised" else rule.clear_message
+            events.append({
+                "rule": rule.name,
+                "event": event,
+                "severity": rule.severity,
+                "message": message,
+                "value": round(value, 2) if isinstance(value, float) else value,
+                "limit": round(limit, 2) if isinstance(limit, float) else limit,
+                "ts": ts.isoformat(timespec="seconds"),
+            })
+        return events
+
+    def active(self):
+        return [{"rule": r.name, "severity": r.severity} for r in self.rules if r.active]
+
+
+def snapshot_values(data):
+    # Alle Gruppen eines Snapshots flach; Einstellungen sind die zuletzt gelesenen (gecacht)
+    values = {}
+    for group in ("settings", "statistics", "derived", "realtime"):
+        values.update(data.get(group) or {})
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER Alarmregeln")
+    parser.add_argument("--rules", default=ALARM_RULES, help="Regeldatei (JSON)")
+    parser.add_argument("--check", action="store_true", help="Regeln gegen den aktuellen Poller-Snapshot pruefen")
+    args = parser.parse_args()
+
+    rules = load_rules(args.rules)
+    values = None
+    if args.check:
+        from epever_poller import get_snapshot
+        snapshot = get_snapshot()
+        if snapshot is None:
+            print("FEHLER: Kein Snapshot vom Poller")
+            raise SystemExit(1)
+        values = snapshot_values(snapshot)
+    for rule in rules:
+        line = f"  {rule.name:16s} {rule.severity:9s} {rule.describe()}"
+        if values is not None:
+            if not rule.names.issubset(values):
+                state = "fehlende Werte: " + ", ".join(sorted(rule.names - set(values)))
+            else:
+                value, limit = rule.sides_of(values)
+                hit = eval(rule.code, {"__builtins__": {}}, values)
+                state = ("ERFUELLT" if hit else "ok") + (f" ({value} / {limit})" if rule.sides else "")
+            line += f"  -> {state}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Minimaler MQTT-3.1.1-Broker fuer Benchmarks
+
+Nimmt CONNECT, PUBLISH (QoS 0/1), SUBSCRIBE und PINGREQ an, bestaetigt QoS 1
+mit PUBACK und zaehlt Nachrichten und Bytes. Kein Ersatz fuer Mosquitto,
+nur eine reproduzierbare Gegenstelle ohne Netzwerk-Latenz.
+"""
+
+import socket
+import struct
+import threading
+
+
+def _recv_exact(sock, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError
+        buf += chunk
+    return buf
+
+
+def _read_length(sock):
+    mult, value = 1, 0
+    while True:
+        b = _recv_exact(sock, 1)[0]
+        value += (b & 127) * mult
+        if not b & 128:
+            return value
+        mult *= 128
+
+
+def _encode_length(n):
+    out = b""
+    while True:
+        digit, n = n % 128, n // 128
+        out += bytes([digit | (128 if n else 0)])
+        if not n:
+            return out
+
+
+class MqttBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(16)
+        self.host, self.port = self.sock.getsockname()
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.retained = {}
+        self.reset()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            self.messages = 0
+            self.payload_bytes = 0
+            self.wire_bytes = 0
+            self.topics = {}
+
+    def stats(self):
+        with self.lock:
+            return {"messages": self.messages, "payload_bytes": self.payload_bytes, "wire_bytes": self.wire_bytes}
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.client, args=(conn,), daemon=True).start()
+
+    def client(self, conn):
+        try:
+            while True:
+                header = _recv_exact(conn, 1)[0]
+                length = _read_length(conn)
+                body = _recv_exact(conn, length)
+                kind = header >> 4
+                if kind == 1:
+                    conn.sendall(b"\x20\x02\x00\x00")
+                elif kind == 3:
+                    self.on_publish(conn, header, length, body)
+                elif kind == 8:
+                    self.on_subscribe(conn, body)
+                elif kind == 12:
+                    conn.sendall(b"\xd0\x00")
+                elif kind == 14:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.lock:
+                self.subscriptions = [(c, f) for c, f in self.subscriptions if c is not conn]
+            conn.close()
+
+    def on_publish(self, conn, header, length, body):
+        qos, retain = (header >> 1) & 3, header & 1
+        topic_len = struct.unpack(">H", body[:2])[0]
+        topic = body[2:2 + topic_len].decode()
+        pos = 2 + topic_len
+        if qos:
+            conn.sendall(b"\x40\x02" + body[pos:pos + 2])
+            pos += 2
+        payload = body[pos:]
+        with self.lock:
+            self.messages += 1
+            self.payload_bytes += len(topic) + len(payload)
+            self.wire_bytes += 1 + len(_encode_length(length)) + length
+            self.topics[topic] = self.topics.get(topic, 0) + 1
+            if retain:
+                self.retained[topic] = payload
+            subscribers = [c for c, f in self.subscriptions
+                           if f == topic or f == "#" or (f.endswith("/#") and topic.startswith(f[:-1]))]
+        packet = body[:2 + topic_len] + payload
+        for sub in subscribers:
+            try:
+                sub.sendall(b"\x30" + _encode_length(len(packet)) + packet)
+            except OSError:
+                pass
+
+    def on_subscribe(self, conn, body):
+        pos, filters = 2, []
+        while pos < len(body):
+            n = struct.unpack(">H", body[pos:pos + 2])[0]
+            filters.append(body[pos + 2:pos + 2 + n].decode())
+            pos += 3 + n
+        conn.sendall(b"\x90" + _encode_length(2 + len(filters)) + body[:2] + b"\x00" * len(filters))
+        with self.lock:
+            self.subscriptions += [(conn, f) for f in filters]
+
+    def close(self):
+        self.sock.close()
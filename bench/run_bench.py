@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+EPEVER Benchmarks - reproduzierbar gegen Simulator und lokalen MQTT-Broker
+
+Misst ohne echte Hardware:
+    poll_cycle  Zykluszeit von get_all_data (p50/p95/p99), Transaktionen und Bytes pro Zyklus
+    decode      Dekodierzeit aller Bloecke eines Zyklus (aufgezeichnete Antworten),
+                vorkompilierter Codec gegen den bisherigen Weg, einzeln und als Bulk
+    mqtt        send_to_mqtt: Nachrichten, Bytes und Zeit pro Zyklus je Publish-Modus
+    payload     State-Payload je PAYLOAD_ENCODING: Groesse und Kodierzeit (json, msgpack, cbor, packed)
+    startup     Kaltstart je Einstiegspunkt: Importzeit und Zeit bis zum ersten Messwert (eigener Prozess)
+    api         /api/data Durchsatz und Latenz mit parallelen Clients (Poller + Flask)
+
+    python bench/run_bench.py --output bench.json
+    python bench/run_bench.py --only poll_cycle decode --latency 0.05
+    python bench/run_bench.py --compare bench.json      # Abweichung zu einem frueheren Lauf
+
+Die Ergebnisse sind JSON, damit Laeufe verschiedener Commits vergleichbar sind.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import argparse
+import platform
+import threading
+import subprocess
+import contextlib
+import http.client
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mqtt_broker import MqttBroker
+
+BENCHMARKS = ["poll_cycle", "decode", "mqtt", "payload", "startup", "api"]
+
+# Module, deren Importzeit gemessen wird (nicht vorhandene werden uebersprungen)
+STARTUP_MODULES = ["epever_core", "epever_controller", "epever_async", "mqtt_service", "epever_poller", "webapp",
+                   "fleet_gateway"]
+
+
+def summarize(samples, scale=1000, digits=3):
+    # Kennzahlen einer Messreihe in ms (bzw. scale)
+    from poll_scheduler import percentile
+    if not samples:
+        return None
+    return {
+        "n": len(samples),
+        "mean": round(sum(samples) / len(samples) * scale, digits),
+        "p50": round(percentile(samples, 50) * scale, digits),
+        "p95": round(percentile(samples, 95) * scale, digits),
+        "p99": round(percentile(samples, 99) * scale, digits),
+        "max": round(max(samples) * scale, digits),
+    }
+
+
+def start_simulator(args, speed=1.0):
+    from epever_simulator import Simulator
+    sim = Simulator(port=0, speed=speed, start_hour=10, latency=args.latency, jitter=args.jitter)
+    return sim, sim.start()
+
+
+def bench_poll_cycle(args):
+    from epever_core import EpeverController
+    sim, (host, port) = start_simulator(args)
+    ctrl = EpeverController(host, port)
+    ctrl.connect()
+    ctrl.get_all_data()
+    before = dict(sim.bridge.stats)
+    samples = []
+    for _ in range(args.cycles):
+        started = time.perf_counter()
+        ctrl.get_all_data()
+        samples.append(time.perf_counter() - started)
+    after = sim.bridge.stats
+    ctrl.disconnect()
+    sim.stop()
+    per_cycle = lambda key: round((after[key] - before[key]) / args.cycles, 2)
+    return {
+        "latency_ms": summarize(samples),
+        "transactions_per_cycle": per_cycle("requests"),
+        "request_bytes_per_cycle": per_cycle("bytes_in"),
+        "response_bytes_per_cycle": per_cycle("bytes_out"),
+        "bridge_latency_s": args.latency,
+    }
+
+
+def capture_frames(args):
+    # Antworten eines kompletten Zyklus aufzeichnen: (Start, Register, Felder)
+    from epever_core import EpeverController
+    sim, (host, port) = start_simulator(args)
+    ctrl = EpeverController(host, port)
+    ctrl.connect()
+    frames = []
+    for plan in ctrl.plans.values():
+        for kind, start, count, fields in plan:
+            frames.append((start, ctrl.read_block(kind, start, count), fields))
+    ctrl.disconnect()
+    sim.stop()
+    return frames
+
+
+def legacy_decode(start, regs, fields):
+    # Bisheriger Weg zum Vergleich: Feld fuer Feld, danach zweiter Rundungsdurchlauf (round_dict)
+    from epever_core import decode_32bit
+    data = {}
+    for addr, sid, kind, dtype, factor, group, options in fields:
+        i = addr - start
+        raw = decode_32bit(regs[i], regs[i + 1]) if dtype in ("u32", "s32") else regs[i]
+        if options:
+            data[sid] = options.get(raw, f"Unbekannt({raw})")
+            data[f"{sid}_raw"] = raw
+        else:
+            data[sid] = raw if factor == 1 else round(raw * factor, 2)
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in data.items()}
+
+
+def bench_decode(args):
+    frames = capture_frames(args)
+    rounds = args.cycles * 50
+
+    def measure(decode):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for start, regs, fields in frames:
+                decode(start, regs, fields)
+            samples.append(time.perf_counter() - started)
+        return summarize(samples, scale=1e6, digits=2)
+
+    # Bulk: dieselben Zyklen als aufgezeichnete Frames, pro Block ein decode_many
+    captured = [(fields, [regs] * rounds) for _, regs, fields in frames]
+    started = time.perf_counter()
+    for fields, blocks in captured:
+        fields.decode_many(blocks)
+    bulk = time.perf_counter() - started
+    started = time.perf_counter()
+    for (start, regs, _), (fields, blocks) in zip(frames, captured):
+        for block in blocks:
+            legacy_decode(start, block, fields)
+    legacy_bulk = time.perf_counter() - started
+
+    legacy, compiled = measure(legacy_decode), measure(lambda start, regs, fields: fields.decode(regs))
+    return {
+        "blocks_per_cycle": len(frames),
+        "fields_per_cycle": sum(len(f) for _, _, f in frames),
+        "decode_us": compiled,
+        "legacy_decode_us": legacy,
+        "speedup_p50": round(legacy["p50"] / compiled["p50"], 2),
+        "bulk_cycles": rounds,
+        "bulk_us_per_cycle": round(bulk / rounds * 1e6, 2),
+        "legacy_bulk_us_per_cycle": round(legacy_bulk / rounds * 1e6, 2),
+    }
+
+
+def bench_mqtt(args):
+    broker = MqttBroker()
+    os.environ.update({"MQTT_SERVER": broker.host, "MQTT_PORT": str(broker.port), "MQTT_USER": "",
+                       "MQTT_PASS": "", "MQTT_BUFFER_DB": os.path.join(tempfile.mkdtemp(), "mqtt_buffer.db")})
+    import mqtt_service
+    from change_filter import ChangeFilter
+    from epever_core import EpeverController
+
+    # Zeitraffer, damit sich die Werte von Zyklus zu Zyklus aendern
+    sim, (host, port) = start_simulator(args, speed=120)
+    ctrl = EpeverController(host, port)
+    ctrl.connect()
+    snapshots = []
+    for _ in range(args.cycles):
+        snapshots.append(ctrl.get_all_data())
+        time.sleep(0.005)
+    ctrl.disconnect()
+    sim.stop()
+
+    results = {}
+    for mode, field_topics in (("full", False), ("changes", False), ("field_topics", True)):
+        mqtt_service.PUBLISH_MODE = "changes" if mode != "full" else "full"
+        mqtt_service.PUBLISH_FIELD_TOPICS = field_topics
+        mqtt_service.change_filter = ChangeFilter({d[0]: d[5] for d in mqtt_service.SENSOR_DEFINITIONS},
+                                                  mqtt_service.MAX_SILENCE)
+        samples = []
+        broker.reset()
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            mq = mqtt_service.get_publisher()
+            mq.connected.wait(5)
+            mq.flush()
+            discovery = broker.stats()
+            broker.reset()
+            for snapshot in snapshots:
+                started = time.perf_counter()
+                mqtt_service.send_to_mqtt(snapshot)
+                samples.append(time.perf_counter() - started)
+            mq.flush()
+            stats = mq.stats()
+            mqtt_service.stop_publisher()
+        counted = broker.stats()
+        results[mode] = {
+            "messages_per_cycle": round(counted["messages"] / len(snapshots), 2),
+            "payload_bytes_per_cycle": round(counted["payload_bytes"] / len(snapshots), 1),
+            "wire_bytes_per_cycle": round(counted["wire_bytes"] / len(snapshots), 1),
+            "publish_ms": summarize(samples),
+            "ack_p50_ms": stats["ack_p50_ms"],
+            "ack_p95_ms": stats["ack_p95_ms"],
+            "discovery_messages": discovery["messages"],
+        }
+    broker.close()
+    return results
+
+
+def bench_payload(args):
+    from epever_core import EpeverController
+    from energy_stats import EnergyAggregator
+    from payload_codec import PayloadEncoder, ENCODINGS
+    from mqtt_service import STATE_FIELDS
+
+    # Payloads wie in send_to_mqtt, inklusive abgeleiteter Werte
+    sim, (host, port) = start_simulator(args, speed=120)
+    ctrl = EpeverController(host, port)
+    ctrl.connect()
+    aggregator = EnergyAggregator()
+    payloads = []
+    for _ in range(args.cycles):
+        data = ctrl.get_all_data()
+        payloads.append({**data["realtime"], **data["statistics"], **data["settings"],
+                         **aggregator.update(data["realtime"], time.monotonic()),
+                         "last_sync": data["last_update"], "last_update": data["last_update"]})
+    ctrl.disconnect()
+    sim.stop()
+
+    results = {"fields": len(payloads[-1])}
+    for encoding in ENCODINGS:
+        try:
+            encoder = PayloadEncoder(encoding, STATE_FIELDS)
+        except RuntimeError as e:
+            results[encoding] = {"skipped": str(e)}
+            continue
+        schema = encoder.schema_message()
+        samples, sizes = [], []
+        for payload in payloads * 20:
+            started = time.perf_counter()
+            body = encoder.encode(payload)
+            samples.append(time.perf_counter() - started)
+            sizes.append(len(body))
+        results[encoding] = {
+            "bytes": round(sum(sizes) / len(sizes), 1),
+            "encode_us": summarize(samples, scale=1e6, digits=2),
+            "schema_bytes": len(schema) if schema else 0,
+        }
+    for encoding in ENCODINGS[1:]:
+        if "bytes" in results[encoding]:
+            results[encoding]["size_vs_json"] = round(results[encoding]["bytes"] / results["json"]["bytes"], 3)
+    return results
+
+
+def import_time(module):
+    # Kumulierte Importzeit in ms laut -X importtime, jeweils in einem frischen Interpreter
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BASE_DIR,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    for line in reversed(proc.stderr.splitlines()):
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    return None
+
+
+def bench_startup(args):
+    runs = max(3, args.cycles // 40)
+    results = {"runs": runs, "import_ms": {}, "first_reading_ms": {}}
+    for module in STARTUP_MODULES:
+        samples = [import_time(module) for _ in range(runs)]
+        if None not in samples:
+            results["import_ms"][module] = {"min": round(min(samples), 1),
+                                            "p50": round(sorted(samples)[len(samples) // 2], 1)}
+
+    broker = MqttBroker()
+    sim, (host, port) = start_simulator(args)
+    env = {**os.environ, "EPEVER_HOST": host, "EPEVER_PORT": str(port), "MQTT_SERVER": broker.host,
+           "MQTT_PORT": str(broker.port), "MQTT_USER": "", "MQTT_PASS": "", "MQTT_BUFFER_DB": "",
+           "DEVICE_PROFILE": os.path.join(tempfile.mkdtemp(), "device_profile.json"),
+           "EPEVER_SOCKET": os.path.join(tempfile.mkdtemp(), "epever-startup.sock")}
+    controller = [sys.executable, "epever_controller.py", "--ip", host, "--port", str(port)]
+    commands = {
+        "controller --read": controller + ["--read", "0x9000"],
+        "controller --json --direct": controller + ["--json", "--direct"],
+        "mqtt_service --once": [sys.executable, "mqtt_service.py", "--once"],
+    }
+
+    def run_command(cmd):
+        started = time.perf_counter()
+        ok = subprocess.run(cmd, cwd=BASE_DIR, env=env, capture_output=True).returncode == 0
+        return time.perf_counter() - started if ok else None
+
+    def poller_first_snapshot():
+        # Poller starten, gemessen wird bis der erste Snapshot ueber den Socket abrufbar ist
+        from epever_poller import get_snapshot
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "epever_poller.py", "--socket", env["EPEVER_SOCKET"]], cwd=BASE_DIR,
+                                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while proc.poll() is None:
+                try:
+                    if get_snapshot(env["EPEVER_SOCKET"]) is not None:
+                        return time.perf_counter() - started
+                except OSError:
+                    pass
+                time.sleep(0.002)
+            return None
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    measure = {name: (lambda cmd=cmd: run_command(cmd)) for name, cmd in commands.items()}
+    measure["epever_poller (1. Snapshot)"] = poller_first_snapshot
+    for name, run in measure.items():
+        samples = [elapsed for elapsed in (run() for _ in range(runs)) if elapsed is not None]
+        if samples:
+            results["first_reading_ms"][name] = {"min": round(min(samples) * 1000, 1),
+                                                 "p50": round(sorted(samples)[len(samples) // 2] * 1000, 1)}
+    sim.stop()
+    broker.close()
+    return results
+
+
+def bench_api(args):
+    socket_path = os.environ["EPEVER_SOCKET"]
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    from werkzeug.serving import make_server
+    from epever_core import EpeverController
+    from epever_poller import EpeverPoller
+    from poll_scheduler import PollScheduler, poll_groups
+    import webapp
+
+    sim, (host, port) = start_simulator(args)
+    poller = EpeverPoller(EpeverController(host, port), PollScheduler(poll_groups(1, 5, 60)), socket_path)
+    threading.Thread(target=poller.run, daemon=True).start()
+    while poller.snapshot is None:
+        time.sleep(0.05)
+
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = {}
+    for path in ("/api/data", "/api/realtime?fields=pv_power,bat_soc"):
+        samples, errors = [], []
+        deadline = time.perf_counter() + args.duration
+
+        def client():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+                try:
+                    conn.request("GET", path)
+                    resp = conn.getresponse()
+                    resp.read()
+                    if resp.status != 200:
+                        errors.append(resp.status)
+                except OSError as e:
+                    errors.append(str(e))
+                finally:
+                    conn.close()
+                samples.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results[path] = {
+            "clients": args.clients,
+            "requests_per_s": round(len(samples) / args.duration, 1),
+            "latency_ms": summarize(samples),
+            "errors": len(errors),
+        }
+    results["device_requests"] = sim.bridge.stats["requests"]
+    server.shutdown()
+    poller.stop()
+    sim.stop()
+    return results
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    import pymodbus
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pymodbus": pymodbus.__version__,
+        "platform": platform.platform(),
+        "params": {"cycles": args.cycles, "latency": args.latency, "jitter": args.jitter,
+                   "clients": args.clients, "duration": args.duration},
+    }
+
+
+def compare(old, new, path=""):
+    # Zahlenwerte beider Laeufe mit relativer Abweichung auflisten
+    lines = []
+    for key, value in new.items():
+        name = f"{path}.{key}" if path else key
+        before = old.get(key) if isinstance(old, dict) else None
+        if isinstance(value, dict):
+            lines += compare(before or {}, value, name)
+        elif isinstance(value, (int, float)) and isinstance(before, (int, float)) and not isinstance(value, bool):
+            delta = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+            lines.append(f"  {name:60s} {before:>12} -> {value:>12}  {delta}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER Benchmarks")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Nur diese Benchmarks")
+    parser.add_argument("--cycles", type=int, default=200, help="Zyklen pro Messung (default: 200)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latenz des simulierten WiFi-Moduls in s")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Jitter der Latenz in s")
+    parser.add_argument("--clients", type=int, default=8, help="Parallele HTTP-Clients (default: 8)")
+    parser.add_argument("--duration", type=float, default=5, help="Dauer des API-Benchmarks in s (default: 5)")
+    parser.add_argument("--output", "-o", help="Ergebnis als JSON-Datei speichern")
+    parser.add_argument("--compare", metavar="JSON", help="Mit frueherem Ergebnis vergleichen")
+    args = parser.parse_args()
+
+    # Eigener Poller-Socket, muss vor dem ersten Import von epever_poller gesetzt sein
+    os.environ["EPEVER_SOCKET"] = os.path.join(tempfile.mkdtemp(), "epever-bench.sock")
+    result = {"meta": metadata(args)}
+    for name in args.only or BENCHMARKS:
+        print(f"[bench] {name} ...", file=sys.stderr, flush=True)
+        result[name] = globals()[f"bench_{name}"](args)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print(f"\nVergleich mit {args.compare} (Commit {old.get('meta', {}).get('commit')}):", file=sys.stderr)
+        print("\n".join(compare({k: v for k, v in old.items() if k != "meta"},
+                                {k: v for k, v in result.items() if k != "meta"})), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
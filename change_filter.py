@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Aenderungsgesteuertes Publizieren
+
+Vergleicht jedes Feld mit dem zuletzt gesendeten Wert. Ein Feld wird nur
+gesendet, wenn es sich um mehr als sein Totband geaendert hat oder laenger als
+max_silence Sekunden nicht gesendet wurde (Heartbeat).
+
+Totband-Angabe pro Feld:
+    0.05    - absolut (gleiche Einheit wie der Wert)
+    "2%"    - relativ zum zuletzt gesendeten Wert
+    None    - jede Aenderung wird gesendet
+"""
+
+import time
+
+# Zeitstempel loesen keine Sendung aus, werden aber mit jeder Aenderung mitgeschickt
+ALWAYS_FIELDS = ("last_update", "last_sync")
+
+
+def parse_deadband(spec):
+    if spec is None:
+        return 0.0, 0.0
+    if isinstance(spec, str) and spec.endswith("%"):
+        return 0.0, float(spec[:-1]) / 100
+    return float(spec), 0.0
+
+
+class ChangeFilter:
+    def __init__(self, deadbands=None, max_silence=300):
+        self.deadbands = {k: parse_deadband(v) for k, v in (deadbands or {}).items()}
+        self.max_silence = max_silence
+        self.last = {}
+        self.bytes_full = 0
+        self.bytes_sent = 0
+
+    def exceeds(self, field, old, new):
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+            return new != old
+        absolute, relative = self.deadbands.get(field, (0.0, 0.0))
+        limit = max(absolute, relative * abs(old))
+        if limit == 0:
+            return new != old
+        return abs(new - old) > limit
+
+    def update(self, payload, now=None):
+        now = time.time() if now is None else now
+        changes = {}
+        for field, value in payload.items():
+            if field in ALWAYS_FIELDS:
+                continue
+            last = self.last.get(field)
+            if last is None or now - last[1] >= self.max_silence or self.exceeds(field, last[0], value):
+                changes[field] = value
+                self.last[field] = (value, now)
+        if changes:
+            for field in ALWAYS_FIELDS:
+                if field in payload:
+                    changes[field] = payload[field]
+        return changes
+
+    def account(self, full_bytes, sent_bytes):
+        self.bytes_full += full_bytes
+        self.bytes_sent += sent_bytes
+
+    def stats(self):
+        saved = self.bytes_full - self.bytes_sent
+        return {
+            "bytes_full": self.bytes_full,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": saved,
+            "saved_pct": round(100 * saved / self.bytes_full, 1) if self.bytes_full else 0.0,
+        }
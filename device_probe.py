@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Grenzen des WiFi-Moduls messen und als Geraeteprofil speichern
+
+Ermittelt fuer ein Geraet die groesste funktionierende Blockgroesse, die
+gueltigen Adressbereiche rund um die Register aus REGISTER_MAP und die Latenz
+pro Transaktion. Das Modell wird aus den Nenndaten ab 0x3000 bestimmt. Das
+Ergebnis landet in DEVICE_PROFILE und wird von EpeverController beim Start
+geladen, spaetere Abfragen nutzen also ohne erneutes Messen die groessten
+sicheren Bloecke.
+
+    python epever_controller.py --probe
+    python epever_controller.py --plan        # Leseplan mit Geraeteprofil
+
+Antworttypen beim Messen:
+    ok       - alle angefragten Register geliefert
+    short    - leere oder unvollstaendige Antwort (Block zu gross, NOTES.md)
+    error    - Modbus-Exception (ungueltige Adresse)
+    timeout  - keine Antwort
+"""
+
+import os
+import json
+import time
+
+from pymodbus.exceptions import ModbusIOException
+
+from epever_core import (REGISTER_MAP, DEVICE_INFO_MAP, REGISTER_WIDTH, MAX_BLOCK_GAP, DEVICE_PROFILE,
+                         profile_key, compile_plan)
+from poll_scheduler import percentile
+
+# Groesste getestete Blockgroesse (Modbus erlaubt 125 Register pro Anfrage)
+PROBE_MAX_BLOCK = 64
+LATENCY_SAMPLES = 10
+
+READ_METHODS = {
+    "input": "read_input_registers",
+    "holding": "read_holding_registers",
+    "coil": "read_coils",
+    "discrete": "read_discrete_inputs",
+}
+
+# Nenndaten (PV-Spannung V, Nennstrom A) -> Modell
+MODELS = {
+    (60, 10): "XTRA-N 1206", (60, 20): "XTRA-N 2206",
+    (100, 20): "XTRA-N 2210", (100, 30): "XTRA-N 3210", (100, 40): "XTRA-N 4210",
+    (150, 30): "XTRA-N 3215", (150, 40): "XTRA-N 4415",
+}
+
+
+def read_raw(ctrl, kind, addr, count):
+    """Einzelne Abfrage mit Antworttyp und Dauer, ohne Fehlerbehandlung des Controllers"""
+    method = getattr(ctrl.client, READ_METHODS[kind])
+    started = time.perf_counter()
+    try:
+        result = method(addr, count, slave=ctrl.slave_id)
+    except Exception:
+        result = None
+    elapsed = time.perf_counter() - started
+    if result is None or isinstance(result, ModbusIOException):
+        if not ctrl.is_connected():
+            ctrl.connect()
+        return "timeout", None, elapsed
+    if result.isError():
+        return "error", None, elapsed
+    # Coils/Discrete Inputs kommen auf volle Bytes aufgefuellt zurueck
+    values = result.registers if kind in ("input", "holding") else [int(b) for b in result.bits[:count]]
+    if len(values) != count:
+        return "short", None, elapsed
+    return "ok", values, elapsed
+
+
+def probe_areas(entries=REGISTER_MAP + DEVICE_INFO_MAP, max_gap=MAX_BLOCK_GAP):
+    # Zusammenhaengende Adressbereiche (Registertyp, erste, letzte Adresse) der bekannten Register
+    areas = []
+    for addr, _, kind, dtype, *_ in sorted(entries, key=lambda e: (e[2], e[0])):
+        end = addr + REGISTER_WIDTH[dtype] - 1
+        if areas and areas[-1][0] == kind and addr - areas[-1][2] - 1 <= max_gap:
+            areas[-1] = (kind, areas[-1][1], max(areas[-1][2], end))
+        else:
+            areas.append((kind, addr, end))
+    return areas
+
+
+def find_max_block(ctrl, areas, limit=PROBE_MAX_BLOCK, latencies=None):
+    """Groesste Blockgroesse, die an mindestens einer Startadresse vollstaendig gelesen wird"""
+    best = 0
+    for kind, start, _ in areas:
+        # Untere Grenze wachsen lassen, danach binaer suchen; nur Groessen ueber best sind interessant
+        low, high = best, limit + 1
+        size = max(best + 1, 1)
+        while size < high:
+            status, _, elapsed = read_raw(ctrl, kind, start, size)
+            if status != "ok":
+                high = size
+                break
+            if latencies is not None:
+                latencies.append(elapsed)
+            low = size
+            size *= 2
+        while high - low > 1:
+            mid = (low + high) // 2
+            if read_raw(ctrl, kind, start, mid)[0] == "ok":
+                low = mid
+            else:
+                high = mid
+        best = max(best, low)
+    return best
+
+
+def valid_addresses(ctrl, kind, start, end, max_block, latencies=None):
+    """Gueltige Adressen zwischen start und end; Fehlerbloecke werden halbiert bis zur Einzeladresse"""
+    valid = []
+    pending = [(a, min(max_block, end - a + 1)) for a in range(start, end + 1, max_block)]
+    while pending:
+        addr, count = pending.pop(0)
+        status, _, elapsed = read_raw(ctrl, kind, addr, count)
+        if status == "ok":
+            valid.extend(range(addr, addr + count))
+            if latencies is not None:
+                latencies.append(elapsed)
+        elif count > 1:
+            half = count // 2
+            pending[:0] = [(addr, half), (addr + half, count - half)]
+    return valid
+
+
+def to_ranges(addresses):
+    ranges = []
+    for addr in sorted(addresses):
+        if ranges and ranges[-1][1] == addr - 1:
+            ranges[-1][1] = addr
+        else:
+            ranges.append([addr, addr])
+    return ranges
+
+
+def detect_model(info):
+    volts, amps = info.get("max_pv_volt"), info.get("rated_current")
+    if volts is None or amps is None:
+        return None
+    return MODELS.get((round(volts), round(amps)), f"EPEVER {round(amps)} A / {round(volts)} V")
+
+
+def measure_latency(ctrl, kind, addr, count, samples=LATENCY_SAMPLES):
+    latencies = []
+    for _ in range(samples):
+        status, _, elapsed = read_raw(ctrl, kind, addr, count)
+        if status == "ok":
+            latencies.append(elapsed)
+    return latencies
+
+
+def ms_stats(latencies):
+    if not latencies:
+        return None
+    return {"p50": round(percentile(latencies, 50) * 1000, 1), "p95": round(percentile(latencies, 95) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1), "n": len(latencies)}
+
+
+def probe(ctrl, limit=PROBE_MAX_BLOCK):
+    started = time.perf_counter()
+    areas = probe_areas()
+    scan_latencies = []
+    max_block = find_max_block(ctrl, areas, limit, scan_latencies)
+    if not max_block:
+        raise RuntimeError("Kein einziger Block lesbar, Verbindung oder Slave-ID pruefen")
+
+    valid, invalid = {"input": [], "holding": []}, []
+    for kind, start, end in areas:
+        found = valid_addresses(ctrl, kind, start, end, max_block, scan_latencies)
+        valid[kind] += found
+        invalid += sorted(set(range(start, end + 1)) - set(found))
+
+    info = compile_plan(DEVICE_INFO_MAP, max_block, set(invalid))
+    device_info = {}
+    for kind, start, count, decoder in info:
+        status, regs, _ = read_raw(ctrl, kind, start, count)
+        if status == "ok":
+            device_info.update(decoder.decode(regs))
+
+    single = measure_latency(ctrl, "input", 0x3100, 1)
+    block = measure_latency(ctrl, "input", 0x3100, min(max_block, 0x3113 - 0x3100 + 1))
+    return {
+        "model": detect_model(device_info),
+        "device_info": device_info,
+        "max_block": max_block,
+        "valid": {kind: to_ranges(addrs) for kind, addrs in valid.items()},
+        "invalid": sorted(invalid),
+        "latency_ms": {"single": ms_stats(single), "block": ms_stats(block), "all": ms_stats(scan_latencies)},
+        "probed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "probe_duration_s": round(time.perf_counter() - started, 1),
+    }
+
+
+def save_profile(profile, host, port, slave_id, path=DEVICE_PROFILE):
+    profiles = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                profiles = json.load(f)
+        except ValueError:
+            pass
+    profiles[profile_key(host, port, slave_id)] = profile
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def format_profile(profile):
+    latency = profile["latency_ms"]
+    fmt = lambda s: f"p50 {s['p50']} ms, p95 {s['p95']} ms" if s else "-"
+    lines = [
+        f"Modell:         {profile['model'] or 'unbekannt'}",
+        f"Max. Block:     {profile['max_block']} Register",
+        f"Latenz 1 Reg.:  {fmt(latency['single'])}",
+        f"Latenz Block:   {fmt(latency['block'])}",
+    ]
+    for kind, ranges in profile["valid"].items():
+        text = ", ".join(f"0x{lo:04X}-0x{hi:04X}" if lo != hi else f"0x{lo:04X}" for lo, hi in ranges)
+        lines.append(f"Gueltig {kind + ':':8s}{text}")
+    lines.append(f"Ungueltig:      {', '.join(f'0x{a:04X}' for a in profile['invalid']) or '-'}")
+    lines.append(f"Dauer:          {profile['probe_duration_s']} s")
+    return "\n".join(lines)
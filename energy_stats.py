@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Abgeleitete Werte pro Abfrage: Energiezaehler und gleitende Aggregate
+
+Die kWh-Zaehler des Geraets (0x3304/0x330C) zaehlen nur in 0.01-kWh-Schritten.
+Hier wird pv_power, charge_power und load_power mit den tatsaechlichen
+Abfragezeitpunkten (Trapezregel) zu Wh-Zaehlern aufsummiert. Dazu kommen
+gleitende min/max/Mittelwerte ueber 1 Minute, 15 Minuten und 1 Stunde.
+
+Pro Abfrage ist der Aufwand konstant (amortisiert): min/max ueber monotone
+Deques, der Mittelwert zeitgewichtet ueber eine laufende Summe der Flaechen.
+Laengere Luecken (MAX_GAP, z.B. Geraet nicht erreichbar) werden weder
+integriert noch gemittelt. Die Zaehler beginnen bei jedem Start bei 0, Home
+Assistant wertet das bei total_increasing als Zaehler-Reset.
+"""
+
+import os
+from collections import deque
+
+# (Leistung, Energiezaehler, Name)
+ENERGY_FIELDS = [
+    ("pv_power", "pv_energy_wh", "PV Energie"),
+    ("charge_power", "charge_energy_wh", "Ladeenergie"),
+    ("load_power", "load_energy_wh", "Last Energie"),
+]
+
+# (Name, Fenster in s)
+WINDOWS = [("1m", 60), ("15m", 900), ("1h", 3600)]
+
+AGGREGATE_FIELDS = [f for f in os.environ.get('AGGREGATE_FIELDS', 'pv_power,charge_power,load_power,bat_voltage')
+                    .split(",") if f.strip()]
+MAX_GAP = float(os.environ.get('AGGREGATE_MAX_GAP', 300))
+
+WINDOW_NAMES = {"1m": "1 min", "15m": "15 min", "1h": "1 h"}
+STAT_NAMES = {"min": "Min", "max": "Max", "mean": "Mittel"}
+
+
+class RollingWindow:
+    def __init__(self, span):
+        self.span = span
+        self.mins = deque()
+        self.maxs = deque()
+        # (Ende, Dauer, Flaeche) der Abschnitte zwischen zwei Abfragen
+        self.segments = deque()
+        self.area = 0.0
+        self.duration = 0.0
+
+    def add(self, ts, value, segment=None):
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((ts, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((ts, value))
+        if segment is not None:
+            self.segments.append((ts, *segment))
+            self.area += segment[1]
+            self.duration += segment[0]
+        start = ts - self.span
+        while self.mins[0][0] < start:
+            self.mins.popleft()
+        while self.maxs[0][0] < start:
+            self.maxs.popleft()
+        while self.segments and self.segments[0][0] - self.segments[0][1] < start:
+            _, duration, area = self.segments.popleft()
+            self.area -= area
+            self.duration -= duration
+        if not self.segments:
+            self.area = self.duration = 0.0
+
+    def stats(self, current):
+        mean = self.area / self.duration if self.duration > 0 else current
+        return self.mins[0][1], self.maxs[0][1], mean
+
+
+class EnergyAggregator:
+    def __init__(self, fields=AGGREGATE_FIELDS, windows=WINDOWS, energy=ENERGY_FIELDS, max_gap=MAX_GAP):
+        self.energy = energy
+        self.max_gap = max_gap
+        self.windows = {field: [(name, RollingWindow(span)) for name, span in windows] for field in fields}
+        self.totals = {counter: 0.0 for _, counter, _ in energy}
+        self.last = {}
+
+    def update(self, values, ts):
+        """Neue Abfrage (ts in Sekunden, monoton); liefert alle abgeleiteten Werte"""
+        segments = {}
+        for field in set(self.windows) | {power for power, _, _ in self.energy}:
+            value = values.get(field)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            previous = self.last.get(field)
+            if previous is not None and 0 < ts - previous[0] <= self.max_gap:
+                dt = ts - previous[0]
+                segments[field] = (dt, (previous[1] + value) / 2 * dt)
+            self.last[field] = (ts, value)
+        for power, counter, _ in self.energy:
+            if power in segments:
+                self.totals[counter] += segments[power][1] / 3600
+        derived = {counter: round(total, 3) for counter, total in self.totals.items()}
+        for field, windows in self.windows.items():
+            if field not in self.last or self.last[field][0] != ts:
+                continue
+            value = self.last[field][1]
+            for name, window in windows:
+                window.add(ts, value, segments.get(field))
+                low, high, mean = window.stats(value)
+                derived[f"{field}_{name}_min"] = low
+                derived[f"{field}_{name}_max"] = high
+                derived[f"{field}_{name}_mean"] = round(mean, 2)
+        return derived
+
+
+def derived_definitions(base, fields=AGGREGATE_FIELDS, windows=WINDOWS, energy=ENERGY_FIELDS):
+    """Sensor-Definitionen (ID, Name, Einheit, Device-Class, State-Class, Totband) der abgeleiteten Werte"""
+    by_id = {d[0]: d for d in base}
+    definitions = []
+    for _, counter, name in energy:
+        definitions.append((counter, f"{name} (Wh)", "Wh", "energy", "total_increasing", 1))
+    for field in fields:
+        if field not in by_id:
+            continue
+        _, name, unit, d_class, _, deadband = by_id[field]
+        for window, _ in windows:
+            for stat in ("min", "max", "mean"):
+                definitions.append((f"{field}_{window}_{stat}", f"{name} {STAT_NAMES[stat]} {WINDOW_NAMES[window]}",
+                                    unit, d_class, "measurement", deadband))
+    return definitions
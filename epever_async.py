@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+EPEVER asyncio-Controller auf Basis von pymodbus' AsyncModbusTcpClient
+
+Gleiche Register-API wie EpeverController (read_input, read_holding,
+get_all_data, ...), aber ohne den Aufrufer zu blockieren. Geraete-I/O kann so
+in einer Event-Loop mit MQTT- und HTTP-Arbeit verzahnt werden.
+
+    python epever_async.py              # Alle Daten als JSON
+    python epever_async.py --timeout 2  # Timeout pro Abfrage
+
+Das WiFi-Modul bearbeitet nur eine Anfrage gleichzeitig, deshalb laufen alle
+Abfragen ueber einen Lock. Nach Timeout oder Abbruch wird die Verbindung
+geschlossen, damit keine verspaetete Antwort der naechsten Anfrage zugeordnet
+wird.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epever_core import (EPEVER_HOST, EPEVER_PORT, SLAVE_ID, MODBUS_TIMEOUT,
+                         BREAKER_THRESHOLD, compile_plans, decode_block, backoff_delay,
+                         device_limits, MODBUS_LATENCY, MODBUS_TIMEOUTS, MODBUS_SHORT_READS, MODBUS_CONNECTS,
+                         MODBUS_RECONNECTS)
+
+
+def transport_error(exc):
+    # Verbindung zum WiFi-Modul gestoert (betrifft alle Slaves dahinter), nicht nur ein Slave ohne Antwort
+    from pymodbus.exceptions import ConnectionException
+    return isinstance(exc, (OSError, ConnectionException)) and not isinstance(exc, asyncio.TimeoutError)
+
+
+class AsyncEpeverController:
+    def __init__(self, host=EPEVER_HOST, port=EPEVER_PORT, slave_id=SLAVE_ID, max_block=None,
+                 timeout=MODBUS_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.slave_id = slave_id
+        self.timeout = timeout
+        self.client = None
+        self.max_block, self.invalid, self.profile = device_limits(host, port, slave_id, max_block)
+        self.plans = compile_plans(self.max_block, self.invalid)
+        self.lock = asyncio.Lock()
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.failures = 0
+        self.next_attempt = 0
+
+    async def connect(self):
+        # Eigene Reconnect-Logik des Clients aus, Wiederverbindung steuert der Aufrufer
+        from pymodbus.client import AsyncModbusTcpClient
+        self.client = AsyncModbusTcpClient(self.host, port=self.port, timeout=self.timeout, reconnect_delay=0)
+        try:
+            ok = await asyncio.wait_for(self.client.connect(), self.timeout)
+        except asyncio.TimeoutError:
+            self.client.close()
+            ok = False
+        MODBUS_CONNECTS.inc(result="ok" if ok else "failed")
+        if ok:
+            self.connect_count += 1
+        return ok
+
+    async def ensure_connected(self):
+        if self.is_connected():
+            return True
+        if time.monotonic() < self.next_attempt:
+            return False
+        self.disconnect()
+        had_connection = self.connect_count > 0
+        if await self.connect():
+            self.failures = 0
+            self.next_attempt = 0
+            if had_connection:
+                self.reconnect_count += 1
+                MODBUS_RECONNECTS.inc()
+            return True
+        self.mark_failure()
+        return False
+
+    def mark_failure(self):
+        self.failures += 1
+        self.next_attempt = time.monotonic() + backoff_delay(self.failures)
+        self.disconnect()
+
+    def breaker_open(self):
+        return self.failures >= BREAKER_THRESHOLD and time.monotonic() < self.next_attempt
+
+    def disconnect(self):
+        if self.client:
+            self.client.close()
+
+    def is_connected(self):
+        return self.client is not None and self.client.connected
+
+    async def _call(self, method, *args, timeout=None):
+        async with self.lock:
+            try:
+                return await asyncio.wait_for(method(*args, slave=self.slave_id), timeout or self.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self.disconnect()
+                raise
+
+    async def _read(self, method, kind, addr, count, timeout=None):
+        # Gleiche Metriken wie EpeverController._read (Latenz, Timeouts, unvollstaendige Antworten pro Block)
+        block = f"0x{addr:04X}"
+        started = time.perf_counter()
+        try:
+            result = await self._call(method, addr, count, timeout=timeout)
+        except Exception:
+            MODBUS_TIMEOUTS.inc(kind=kind, block=block)
+            raise
+        finally:
+            MODBUS_LATENCY.observe(time.perf_counter() - started, kind=kind, block=block)
+        if hasattr(result, 'registers') and len(result.registers) == count:
+            return result.registers
+        from pymodbus.exceptions import ModbusIOException
+        if isinstance(result, ModbusIOException):
+            MODBUS_TIMEOUTS.inc(kind=kind, block=block)
+        else:
+            MODBUS_SHORT_READS.inc(kind=kind, block=block)
+        return None
+
+    async def read_input(self, addr, count=1, timeout=None):
+        return await self._read(self.client.read_input_registers, "input", addr, count, timeout)
+
+    async def read_holding(self, addr, count=1, timeout=None):
+        return await self._read(self.client.read_holding_registers, "holding", addr, count, timeout)
+
+    async def write_holding(self, addr, value, timeout=None):
+        result = await self._call(self.client.write_register, addr, value, timeout=timeout)
+        return not result.isError() if hasattr(result, 'isError') else True
+
+    async def write_holdings(self, addr, values, timeout=None):
+        result = await self._call(self.client.write_registers, addr, list(values), timeout=timeout)
+        return not result.isError() if hasattr(result, 'isError') else True
+
+    async def read_block(self, kind, start, count):
+        if kind == "holding":
+            return await self.read_holding(start, count)
+        return await self.read_input(start, count)
+
+    async def read_plan(self, plan, per_slave=False):
+        """Fehlerbehandlung wie EpeverController.read_plan: Timeout, Modbus- oder Socketfehler zaehlen fuer Backoff
+
+        per_slave: mehrere Slaves an einer Verbindung (Fleet); nur Verbindungsfehler zaehlen fuer die
+        Verbindung, ein stummer Slave wird vom Aufrufer einzeln zurueckgestellt.
+        """
+        data = {}
+        if not self.is_connected():
+            return data
+        for kind, start, count, fields in plan:
+            try:
+                regs = await self.read_block(kind, start, count)
+            except Exception as e:
+                if not per_slave or transport_error(e):
+                    self.mark_failure()
+                break
+            if regs:
+                data.update(decode_block(start, regs, fields))
+        if plan and not data and self.is_connected() and not per_slave:
+            # Kein einziger Block gelesen: Verbindung gilt als tot
+            self.mark_failure()
+        elif data:
+            self.failures = 0
+        return data
+
+    async def get_realtime_data(self):
+        return await self.read_plan(self.plans["realtime"])
+
+    async def get_statistics(self):
+        return await self.read_plan(self.plans["statistics"])
+
+    async def get_settings(self):
+        return await self.read_plan(self.plans["settings"])
+
+    async def set_setting(self, register, value):
+        return await self.write_holding(register, int(value))
+
+    async def get_all_data(self):
+        return {
+            "realtime": await self.get_realtime_data(),
+            "statistics": await self.get_statistics(),
+            "settings": await self.get_settings(),
+            "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+
+async def poll_due_async(ctrl, scheduler, snapshot, per_slave=False):
+    # Gegenstueck zu poll_scheduler.poll_due fuer die Event-Loop
+    ran = []
+    for group in scheduler.due():
+        started = scheduler.clock()
+        values = await ctrl.read_plan(ctrl.plans[group], per_slave)
+        scheduler.mark_run(group, started, scheduler.clock())
+        if values:
+            snapshot[group] = values
+            ran.append(group)
+    if "realtime" in ran:
+        snapshot["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return ran
+
+
+async def run(args):
+    ctrl = AsyncEpeverController(args.ip, args.port, timeout=args.timeout)
+    if not await ctrl.connect():
+        print("FEHLER: Keine Verbindung zum EPEVER!")
+        return 1
+    try:
+        print(json.dumps(await ctrl.get_all_data(), indent=2))
+    finally:
+        ctrl.disconnect()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER asyncio Controller")
+    parser.add_argument("--ip", default=EPEVER_HOST, help="IP-Adresse des EPEVER")
+    parser.add_argument("--port", type=int, default=EPEVER_PORT, help="Modbus-Port")
+    parser.add_argument("--timeout", type=float, default=MODBUS_TIMEOUT, help="Timeout pro Abfrage in Sekunden")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+EPEVER Kern: Registertabellen, Leseplaene und EpeverController
+
+Ohne schwere Importe, damit kurze Aufrufe (--read, --json, run_once) und
+Module, die nur die Tabellen brauchen (webapp, Simulator, Profile), schnell
+starten. pymodbus wird erst bei connect() geladen; MQTT, Discovery, CLI und
+interaktives Menue liegen in epever_controller.py bzw. den Diensten.
+"""
+
+import os
+import json
+import time
+import random
+from datetime import datetime
+from register_codec import REGISTER_WIDTH, BlockDecoder
+from metrics import Counter, Gauge, Histogram
+
+# Oeffentliche API (auch fuer "from epever_core import *" in epever_controller.py)
+__all__ = [
+    "EPEVER_HOST", "EPEVER_PORT", "SLAVE_ID", "MODBUS_TIMEOUT", "RECONNECT_BASE_DELAY", "RECONNECT_MAX_DELAY",
+    "BREAKER_THRESHOLD", "BREAKER_COOLDOWN",
+    "BATTERY_TYPES", "CHARGING_STATES", "LOAD_MODES", "REALTIME_INPUTS", "STATISTICS_INPUTS", "SETTINGS_HOLDINGS",
+    "DEVICE_INFO_INPUTS", "MAX_BLOCK_SIZE", "MAX_BLOCK_GAP", "INVALID_REGISTERS", "DEVICE_PROFILE",
+    "REGISTER_MAP", "REGISTER_GROUPS", "DEVICE_INFO_MAP", "REGISTER_WIDTH",
+    "decode_32bit", "decode_signed_32bit", "plan_reads", "compile_plan", "compile_plans", "profile_key",
+    "load_device_profile", "device_limits", "decode_block", "format_plan", "backoff_delay", "EpeverController",
+]
+
+EPEVER_HOST = '192.168.178.150'
+EPEVER_PORT = 8899
+SLAVE_ID = 1
+
+# Dauerhafte Verbindung: Timeout, Backoff und Circuit Breaker
+MODBUS_TIMEOUT = 3
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 120
+
+# Metriken pro Registerblock (Startadresse), siehe metrics.py
+MODBUS_LATENCY = Histogram("epever_modbus_request_seconds", "Dauer einer Modbus-Abfrage pro Registerblock",
+                           ["kind", "block"])
+MODBUS_TIMEOUTS = Counter("epever_modbus_timeouts_total", "Modbus-Abfragen ohne Antwort", ["kind", "block"])
+MODBUS_SHORT_READS = Counter("epever_modbus_short_reads_total",
+                             "Antworten mit weniger Registern als angefragt (oder Exception)", ["kind", "block"])
+MODBUS_CONNECTS = Counter("epever_modbus_connects_total", "Verbindungsversuche zum WiFi-Modul", ["result"])
+MODBUS_RECONNECTS = Counter("epever_modbus_reconnects_total", "Wiederhergestellte Verbindungen")
+MODBUS_FAILURES = Gauge("epever_modbus_consecutive_failures", "Fehler in Folge (Backoff/Circuit Breaker)")
+
+def decode_32bit(low, high):
+    return (high << 16) | low
+
+def decode_signed_32bit(low, high):
+    val = (high << 16) | low
+    if val >= 0x80000000:
+        val -= 0x100000000
+    return val
+
+BATTERY_TYPES = {0: "Sealed", 1: "GEL", 2: "Flooded", 3: "User", 4: "LFP", 5: "Li-NMC"}
+CHARGING_STATES = {0: "Deaktiviert", 1: "Aktiv", 2: "MPPT", 3: "Equalize", 4: "Boost", 5: "Float", 6: "Current Limiting"}
+LOAD_MODES = {
+    0: "Manual", 1: "Light ON/OFF", 2: "Light ON+Timer", 3: "Time Control",
+    4: "Test Mode", 5: "Morning ON", 17: "Street Light (Dusk-Dawn)"
+}
+
+REALTIME_INPUTS = [
+    (0x3100, "pv_voltage", "PV-Spannung", "V", 0.01, "voltage"),
+    (0x3101, "pv_current", "PV-Strom", "A", 0.01, "current"),
+    (0x3102, "pv_power", "PV-Leistung", "W", 0.01, "power", True),
+    (0x3104, "bat_voltage", "Batterie-Spannung", "V", 0.01, "voltage"),
+    (0x3105, "charge_current", "Lade-Strom", "A", 0.01, "current"),
+    (0x3106, "charge_power", "Lade-Leistung", "W", 0.01, "power", True),
+    (0x310C, "load_voltage", "Last-Spannung", "V", 0.01, "voltage"),
+    (0x310D, "load_current", "Last-Strom", "A", 0.01, "current"),
+    (0x310E, "load_power", "Last-Leistung", "W", 0.01, "power", True),
+    (0x3110, "bat_temp", "Batterie-Temp", "°C", 0.01, "temperature"),
+    (0x3111, "dev_temp", "Geräte-Temp", "°C", 0.01, "temperature"),
+    (0x311A, "bat_soc", "Batterie-SOC", "%", 1, "battery"),
+    (0x311B, "bat_soh", "Batterie-SOH", "%", 1, "battery"),
+    (0x311D, "charging_state", "Ladezustand", None, 1, None),
+]
+
+STATISTICS_INPUTS = [
+    (0x3300, "pv_max_today", "Max PV-Spannung heute", "V", 0.01),
+    (0x3301, "bat_min_today", "Min Bat-Spannung heute", "V", 0.01),
+    (0x3302, "bat_max_today", "Max Bat-Spannung heute", "V", 0.01),
+    (0x3304, "consumption_today", "Verbrauch heute", "kWh", 0.01, True),
+    (0x330A, "consumption_total", "Verbrauch gesamt", "kWh", 0.01, True),
+    (0x330C, "generation_today", "Erzeugung heute", "kWh", 0.01, True),
+    (0x330E, "generation_month", "Erzeugung Monat", "kWh", 0.01, True),
+    (0x3312, "generation_total", "Erzeugung gesamt", "kWh", 0.01, True),
+    (0x3314, "co2_saved", "CO2-Ersparnis", "kg", 0.01, True),
+    (0x3316, "running_hours", "Betriebsstunden", "h", 1),
+]
+
+SETTINGS_HOLDINGS = [
+    (0x9000, "bat_type", "Batterietyp", None, 1, "list", list(BATTERY_TYPES.values())),
+    (0x9001, "bat_capacity", "Batteriekapazitaet", "Ah", 1, "number", [1, 2000]),
+    (0x9002, "temp_comp", "Temp-Kompensation", "mV/°C/2V", 1, "number", [0, 100]),
+    (0x9003, "high_volt_disconnect", "HVD - Ueberspannung", "V", 0.01, "number", [10, 60]),
+    (0x9004, "charging_limit_volt", "Ladelimit Spannung", "V", 0.01, "number", [10, 60]),
+    (0x9005, "over_volt_reconnect", "Ueberspannung Wiedereinschalt", "V", 0.01, "number", [10, 60]),
+    (0x9006, "equalize_volt", "Equalize Spannung", "V", 0.01, "number", [10, 60]),
+    (0x9007, "boost_volt", "Boost Spannung", "V", 0.01, "number", [10, 60]),
+    (0x9008, "float_volt", "Float Spannung", "V", 0.01, "number", [10, 60]),
+    (0x9009, "low_volt_disconnect", "LVD - Tiefentladung", "V", 0.01, "number", [8, 50]),
+    (0x900A, "under_volt_warning", "Unterspannung Warnung", "V", 0.01, "number", [8, 50]),
+    (0x900B, "low_volt_reconnect", "Unterspannung Wiedereinschalt", "V", 0.01, "number", [8, 50]),
+    (0x900C, "boost_reconnect_volt", "Boost Wiedereinschalt", "V", 0.01, "number", [8, 50]),
+    (0x9013, "boost_duration", "Boost Dauer", "min", 1, "number", [10, 180]),
+    (0x9014, "equalize_duration", "Equalize Dauer", "min", 1, "number", [0, 300]),
+    (0x903D, "load_mode", "Last-Modus", None, 1, "list", list(LOAD_MODES.values())),
+    (0x903E, "light_on_delay", "Licht AN Verzoegerung", "min", 1, "number", [0, 999]),
+    (0x903F, "light_off_delay", "Licht AUS Verzoegerung", "min", 1, "number", [0, 999]),
+    (0x9042, "load_timer1", "Last Timer 1", "min", 1, "number", [0, 1439]),
+    (0x904E, "load_timer2", "Last Timer 2", "min", 1, "number", [0, 1439]),
+    (0x9065, "device_address", "Geraeteadresse", None, 1, "number", [1, 255]),
+    (0x906E, "bat_recognition", "Batterie-Erkennung", None, 1, "number", [0, 9]),
+]
+
+DEVICE_INFO_INPUTS = [
+    (0x3000, "max_pv_volt", "Max PV-Spannung (Rated)", "V", 0.01),
+    (0x3004, "rated_current", "Nennstrom", "A", 0.01),
+]
+
+# Grenzen des WiFi-Moduls (siehe NOTES.md), ein gemessenes Geraeteprofil hat Vorrang
+MAX_BLOCK_SIZE = 20
+MAX_BLOCK_GAP = MAX_BLOCK_SIZE
+INVALID_REGISTERS = {0x311C, 0x3314, 0x900F, 0x9012, 0x9040, 0x9041, 0x904E, 0x904F}
+
+# Ergebnis von --probe pro Geraet (Host:Port/Slave), siehe device_probe.py
+DEVICE_PROFILE = os.environ.get('DEVICE_PROFILE',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device_profile.json'))
+
+# Deklarative Registertabelle fuer alle Leseabfragen:
+# (Adresse, Name, Registertyp, Datentyp u16/s16/u32/s32, Faktor, Gruppe, Werteliste)
+REGISTER_MAP = [
+    (0x3100, "pv_voltage", "input", "u16", 0.01, "realtime", None),
+    (0x3101, "pv_current", "input", "u16", 0.01, "realtime", None),
+    (0x3102, "pv_power", "input", "u32", 0.01, "realtime", None),
+    (0x3104, "bat_voltage", "input", "u16", 0.01, "realtime", None),
+    (0x3105, "charge_current", "input", "u16", 0.01, "realtime", None),
+    (0x3106, "charge_power", "input", "u32", 0.01, "realtime", None),
+    (0x310C, "load_voltage", "input", "u16", 0.01, "realtime", None),
+    (0x310D, "load_current", "input", "u16", 0.01, "realtime", None),
+    (0x310E, "load_power", "input", "u32", 0.01, "realtime", None),
+    (0x3110, "bat_temp", "input", "s16", 0.01, "realtime", None),
+    (0x3111, "dev_temp", "input", "s16", 0.01, "realtime", None),
+    (0x311A, "bat_soc", "input", "u16", 1, "realtime", None),
+
+    (0x3300, "pv_max_today", "input", "u16", 0.01, "statistics", None),
+    (0x3301, "bat_min_today", "input", "u16", 0.01, "statistics", None),
+    (0x3302, "bat_max_today", "input", "u16", 0.01, "statistics", None),
+    (0x3304, "consumption_today", "input", "u32", 0.01, "statistics", None),
+    (0x330A, "consumption_total", "input", "u32", 0.01, "statistics", None),
+    (0x330C, "generation_today", "input", "u32", 0.01, "statistics", None),
+    (0x3312, "generation_total", "input", "u32", 0.01, "statistics", None),
+
+    (0x9000, "bat_type", "holding", "u16", 1, "settings", BATTERY_TYPES),
+    (0x9001, "bat_capacity", "holding", "u16", 1, "settings", None),
+    (0x9002, "temp_comp", "holding", "u16", 1, "settings", None),
+    (0x9003, "high_volt_disconnect", "holding", "u16", 0.01, "settings", None),
+    (0x9004, "charging_limit_volt", "holding", "u16", 0.01, "settings", None),
+    (0x9005, "over_volt_reconnect", "holding", "u16", 0.01, "settings", None),
+    (0x9006, "equalize_volt", "holding", "u16", 0.01, "settings", None),
+    (0x9007, "boost_volt", "holding", "u16", 0.01, "settings", None),
+    (0x9008, "float_volt", "holding", "u16", 0.01, "settings", None),
+    (0x9009, "low_volt_disconnect", "holding", "u16", 0.01, "settings", None),
+    (0x900A, "under_volt_warning", "holding", "u16", 0.01, "settings", None),
+    (0x900B, "low_volt_reconnect", "holding", "u16", 0.01, "settings", None),
+    (0x900C, "boost_reconnect_volt", "holding", "u16", 0.01, "settings", None),
+    (0x900D, "low_volt_disconnect_2", "holding", "u16", 0.01, "settings", None),
+    (0x900E, "under_volt_disconnect", "holding", "u16", 0.01, "settings", None),
+    (0x9013, "boost_duration", "holding", "u16", 1, "settings", None),
+    (0x9014, "equalize_duration", "holding", "u16", 1, "settings", None),
+    (0x9015, "temp_comp_coeff", "holding", "u16", 1, "settings", None),
+    (0x903D, "load_mode", "holding", "u16", 1, "settings", LOAD_MODES),
+    (0x903E, "light_on_delay", "holding", "u16", 1, "settings", None),
+    (0x903F, "light_off_delay", "holding", "u16", 1, "settings", None),
+]
+
+REGISTER_GROUPS = ["realtime", "statistics", "settings"]
+
+DEVICE_INFO_MAP = [(addr, sid, "input", "u16", factor, "device_info", None)
+                   for addr, sid, name, unit, factor in DEVICE_INFO_INPUTS]
+
+
+def plan_reads(registers, max_block=MAX_BLOCK_SIZE, max_gap=MAX_BLOCK_GAP, invalid=INVALID_REGISTERS):
+    """Fasst Register zu moeglichst wenigen Lesebloecken zusammen.
+
+    Benachbarte Adressen desselben Registertyps landen im selben Block,
+    solange der Block nicht groesser als max_block wird, die Luecke nicht
+    groesser als max_gap ist und keine ungueltige Adresse mitgelesen wird.
+    Ergebnis: Liste von (Registertyp, Startadresse, Anzahl, Eintraege).
+    """
+    blocks = []
+    for entry in sorted(registers, key=lambda e: (e[2], e[0])):
+        addr, kind, width = entry[0], entry[2], REGISTER_WIDTH[entry[3]]
+        end = addr + width - 1
+        if blocks:
+            b_kind, b_start, b_count, b_fields = blocks[-1]
+            b_end = b_start + b_count - 1
+            if (b_kind == kind
+                    and addr - b_end - 1 <= max_gap
+                    and end - b_start + 1 <= max_block
+                    and not any(a in invalid for a in range(b_end + 1, addr))):
+                blocks[-1] = (kind, b_start, max(b_count, end - b_start + 1), b_fields + [entry])
+                continue
+        blocks.append((kind, addr, width, [entry]))
+    return blocks
+
+
+def compile_plan(entries, max_block=MAX_BLOCK_SIZE, invalid=INVALID_REGISTERS):
+    # Jeder Block bekommt seinen vorkompilierten Decoder (register_codec.BlockDecoder)
+    return [(kind, start, count, BlockDecoder(start, count, fields))
+            for kind, start, count, fields in plan_reads(entries, max_block, invalid=invalid)]
+
+
+def compile_plans(max_block=MAX_BLOCK_SIZE, invalid=INVALID_REGISTERS):
+    return {
+        group: compile_plan([e for e in REGISTER_MAP if e[5] == group], max_block, invalid)
+        for group in REGISTER_GROUPS
+    }
+
+
+def profile_key(host, port, slave_id):
+    return f"{host}:{port}/{slave_id}"
+
+
+def load_device_profile(host, port, slave_id, path=DEVICE_PROFILE):
+    try:
+        with open(path) as f:
+            return json.load(f).get(profile_key(host, port, slave_id))
+    except (OSError, ValueError):
+        return None
+
+
+def device_limits(host, port, slave_id, max_block=None, path=DEVICE_PROFILE):
+    """Blockgroesse und ungueltige Adressen: Vorgabe, sonst Geraeteprofil, sonst NOTES.md"""
+    profile = load_device_profile(host, port, slave_id, path)
+    invalid = set(INVALID_REGISTERS)
+    if profile:
+        invalid.update(profile.get("invalid", []))
+    if max_block is None:
+        max_block = profile["max_block"] if profile else MAX_BLOCK_SIZE
+    return max_block, invalid, profile
+
+
+def decode_block(start, regs, fields):
+    if not isinstance(fields, BlockDecoder):
+        fields = BlockDecoder(start, len(regs), fields)
+    return fields.decode(regs)
+
+
+def format_plan(plans, max_block=MAX_BLOCK_SIZE):
+    lines = [f"Leseplan (max. {max_block} Register pro Block)"]
+    total = 0
+    for group, plan in plans.items():
+        total += len(plan)
+        lines.append(f"\n  {group}: {len(plan)} Transaktion(en)")
+        for kind, start, count, fields in plan:
+            names = ", ".join(f[1] for f in fields)
+            lines.append(f"    {kind:8s} 0x{start:04X}-0x{start + count - 1:04X} ({count:2d} Reg.)  {names}")
+    lines.append(f"\n  get_all_data: {total} Transaktion(en) pro Abfrage")
+    return "\n".join(lines)
+
+
+def backoff_delay(failures):
+    # Exponentielles Backoff mit Jitter, ab BREAKER_THRESHOLD Fehlern Circuit Breaker
+    if failures >= BREAKER_THRESHOLD:
+        return BREAKER_COOLDOWN
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (failures - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class EpeverController:
+    def __init__(self, host=EPEVER_HOST, port=EPEVER_PORT, slave_id=SLAVE_ID, max_block=None,
+                 timeout=MODBUS_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.slave_id = slave_id
+        self.timeout = timeout
+        self.client = None
+        # max_block=None: aus dem Geraeteprofil (--probe), sonst MAX_BLOCK_SIZE
+        self.max_block, self.invalid, self.profile = device_limits(host, port, slave_id, max_block)
+        self.plans = compile_plans(self.max_block, self.invalid)
+        self.info_plan = compile_plan(DEVICE_INFO_MAP, self.max_block, self.invalid)
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.failures = 0
+        self.next_attempt = 0
+
+    def connect(self):
+        # pymodbus erst beim Verbinden laden: Tabellen und Leseplaene kommen ohne aus
+        from pymodbus.client import ModbusTcpClient
+        self.client = ModbusTcpClient(self.host, port=self.port, timeout=self.timeout)
+        ok = self.client.connect()
+        if ok:
+            self.connect_count += 1
+        MODBUS_CONNECTS.inc(result="ok" if ok else "failed")
+        return ok
+
+    def disconnect(self):
+        if self.client:
+            self.client.close()
+
+    def is_connected(self):
+        return self.client is not None and self.client.is_socket_open()
+
+    def breaker_open(self):
+        return self.failures >= BREAKER_THRESHOLD and time.monotonic() < self.next_attempt
+
+    def ensure_connected(self):
+        # Fuer Daemons: Verbindung offen halten, nach Fehlern mit Backoff neu aufbauen
+        if self.is_connected():
+            return True
+        if time.monotonic() < self.next_attempt:
+            return False
+        self.disconnect()
+        had_connection = self.connect_count > 0
+        if self.connect():
+            self.failures = 0
+            self.next_attempt = 0
+            if had_connection:
+                self.reconnect_count += 1
+                MODBUS_RECONNECTS.inc()
+            MODBUS_FAILURES.set(0)
+            return True
+        self.mark_failure()
+        return False
+
+    def mark_failure(self):
+        self.failures += 1
+        self.next_attempt = time.monotonic() + backoff_delay(self.failures)
+        MODBUS_FAILURES.set(self.failures)
+        self.disconnect()
+
+    def connection_stats(self):
+        return {
+            "connected": self.is_connected(),
+            "connects": self.connect_count,
+            "reconnects": self.reconnect_count,
+            "failures": self.failures,
+            "breaker_open": self.breaker_open(),
+        }
+
+    def _read(self, method, kind, addr, count):
+        block = f"0x{addr:04X}"
+        started = time.perf_counter()
+        try:
+            result = method(addr, count, slave=self.slave_id)
+        except Exception:
+            MODBUS_TIMEOUTS.inc(kind=kind, block=block)
+            raise
+        finally:
+            MODBUS_LATENCY.observe(time.perf_counter() - started, kind=kind, block=block)
+        if hasattr(result, 'registers') and len(result.registers) == count:
+            return result.registers
+        from pymodbus.exceptions import ModbusIOException
+        if isinstance(result, ModbusIOException):
+            MODBUS_TIMEOUTS.inc(kind=kind, block=block)
+        else:
+            MODBUS_SHORT_READS.inc(kind=kind, block=block)
+        return None
+
+    def read_input(self, addr, count=1):
+        return self._read(self.client.read_input_registers, "input", addr, count)
+
+    def read_holding(self, addr, count=1):
+        return self._read(self.client.read_holding_registers, "holding", addr, count)
+
+    def write_holding(self, addr, value):
+        result = self.client.write_register(addr, value, slave=self.slave_id)
+        return not result.isError() if hasattr(result, 'isError') else True
+
+    def write_holdings(self, addr, values):
+        result = self.client.write_registers(addr, list(values), slave=self.slave_id)
+        return not result.isError() if hasattr(result, 'isError') else True
+
+    def read_block(self, kind, start, count):
+        if kind == "holding":
+            return self.read_holding(start, count)
+        return self.read_input(start, count)
+
+    def read_plan(self, plan):
+        data = {}
+        if not self.is_connected():
+            return data
+        for kind, start, count, fields in plan:
+            try:
+                regs = self.read_block(kind, start, count)
+            except Exception:
+                self.mark_failure()
+                break
+            if regs:
+                data.update(decode_block(start, regs, fields))
+        if plan and not data and self.is_connected():
+            # Kein einziger Block gelesen: Verbindung gilt als tot
+            self.mark_failure()
+        elif data:
+            self.failures = 0
+        return data
+
+    def get_realtime_data(self):
+        return self.read_plan(self.plans["realtime"])
+
+    def get_statistics(self):
+        return self.read_plan(self.plans["statistics"])
+
+    def get_settings(self):
+        return self.read_plan(self.plans["settings"])
+
+    def get_device_info(self):
+        return self.read_plan(self.info_plan)
+
+    def set_setting(self, register, value):
+        return self.write_holding(register, int(value))
+
+    def get_all_data(self):
+        return {
+            "realtime": self.get_realtime_data(),
+            "statistics": self.get_statistics(),
+            "settings": self.get_settings(),
+            "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+EPEVER Poller - einziger Prozess mit Verbindung zum WiFi-Modul
+
+Liest den Laderegler zyklisch aus und stellt den letzten Snapshot ueber einen
+Unix-Socket bereit. Webapp, MQTT-Service und CLI lesen nur noch diesen
+Snapshot, die Last auf dem WiFi-Modul bleibt unabhaengig von der Anzahl der
+Clients konstant.
+
+    python epever_poller.py                 # Poller starten (Echtzeit alle 5s)
+    python epever_poller.py --interval 2    # Echtzeitdaten alle 2 Sekunden
+    python epever_poller.py --adaptive      # 2-60s je nach PV-/Lastaenderung
+
+Protokoll: eine JSON-Zeile pro Anfrage, eine JSON-Zeile als Antwort.
+    {"cmd": "get"}                              -> {"ok": true, "data": {...}, "age": 1.2}
+    {"cmd": "get", "since": 1712345678901}      -> nur seit dieser Version geaenderte Felder
+    {"cmd": "get", "fields": ["pv_power"], "known": 1712345678901}
+    {"cmd": "set", "register": 36865, "value": 100}
+    {"cmd": "apply_profile", "profile": "lfp_12v"}
+    {"cmd": "metrics"}                          -> Prometheus-Metriken als Text
+    {"cmd": "subscribe"}                        -> eine Zeile pro neuem Snapshot
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import signal
+import argparse
+import threading
+import socketserver
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epever_core import EpeverController
+from poll_scheduler import PollScheduler, AdaptiveRate, poll_groups, poll_due, empty_snapshot, SNAPSHOT_GROUPS
+from energy_stats import EnergyAggregator
+from history_store import HistoryStore, HISTORY_DB
+from settings_profiles import load_profiles, apply_profile
+from metrics import REGISTRY
+
+EPEVER_HOST = os.environ.get('EPEVER_HOST', '192.168.178.150')
+EPEVER_PORT = int(os.environ.get('EPEVER_PORT', 8899))
+SLAVE_ID = int(os.environ.get('EPEVER_SLAVE_ID', 1))
+
+POLLER_SOCKET = os.environ.get('EPEVER_SOCKET', '/tmp/epever-poller.sock')
+POLLER_TIMEOUT = float(os.environ.get('EPEVER_SOCKET_TIMEOUT', 5))
+
+
+def request(cmd, socket_path=POLLER_SOCKET, timeout=POLLER_TIMEOUT, **params):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"cmd": cmd, **params}).encode() + b"\n")
+        line = sock.makefile("rb").readline()
+    if not line:
+        raise ConnectionError("Keine Antwort vom Poller")
+    return json.loads(line)
+
+
+def subscribe(socket_path=POLLER_SOCKET, timeout=60):
+    # Generator: liefert jeden neuen Snapshot des Pollers
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"cmd": "subscribe"}).encode() + b"\n")
+        for line in sock.makefile("rb"):
+            msg = json.loads(line)
+            if msg.get("data") is not None:
+                yield msg["data"]
+
+
+def get_snapshot(socket_path=POLLER_SOCKET, max_age=None):
+    try:
+        resp = request("get", socket_path)
+    except (OSError, ValueError):
+        return None
+    if not resp.get("ok"):
+        return None
+    if max_age is not None and resp.get("age", 0) > max_age:
+        return None
+    return resp["data"]
+
+
+class EpeverPoller:
+    def __init__(self, ctrl, scheduler=None, socket_path=POLLER_SOCKET, adaptive=None):
+        self.ctrl = ctrl
+        self.scheduler = scheduler or PollScheduler()
+        self.adaptive = adaptive
+        self.aggregator = EnergyAggregator()
+        self.socket_path = socket_path
+        self.data = empty_snapshot()
+        self.snapshot = None
+        self.snapshot_time = None
+        self.device_lock = threading.Lock()
+        self.running = False
+        self.server = None
+        self.reconnects = 0
+        # Werden nach jeder erfolgreichen Abfrage mit (snapshot, gelesene Gruppen) aufgerufen
+        self.listeners = [self.notify_subscribers]
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+        # Startwert aus der Uhrzeit, damit Versionen auch ueber Neustarts hinweg steigen
+        self.version = int(time.time() * 1000)
+        self.field_versions = {}
+
+    def poll(self):
+        with self.device_lock:
+            if not self.ctrl.ensure_connected():
+                if not self.ctrl.breaker_open():
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Keine Verbindung zum EPEVER", flush=True)
+                return False
+            try:
+                ran = poll_due(self.ctrl, self.scheduler, self.data, self.adaptive, self.aggregator)
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Lesefehler: {e}", flush=True)
+                self.ctrl.mark_failure()
+                return False
+        if self.ctrl.reconnect_count != self.reconnects:
+            self.reconnects = self.ctrl.reconnect_count
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Verbindung wiederhergestellt (Reconnects: {self.reconnects})", flush=True)
+        if not ran or not self.data["realtime"]:
+            return False
+        self.update_snapshot(self.data)
+        for listener in self.listeners:
+            try:
+                listener(self.snapshot, ran)
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Fehler in {getattr(listener, '__name__', listener)}: {e}", flush=True)
+        return True
+
+    def write_setting(self, register, value):
+        with self.device_lock:
+            if not self.ctrl.ensure_connected():
+                return {"ok": False, "error": "Keine Verbindung zum EPEVER"}
+            try:
+                ok = self.ctrl.set_setting(register, value)
+            except Exception:
+                self.ctrl.mark_failure()
+                ok = False
+            if not ok:
+                return {"ok": False, "error": "Schreiben fehlgeschlagen"}
+            settings = self.ctrl.get_settings()
+            self.scheduler.reschedule("settings")
+        if settings:
+            self.data["settings"] = settings
+            if self.snapshot:
+                self.update_snapshot({**self.snapshot, "settings": settings})
+                self.notify_subscribers(self.snapshot, ["settings"])
+        return {"ok": True, "register": register, "value": value}
+
+    def write_profile(self, name=None, values=None):
+        if values is None:
+            profiles = load_profiles()
+            if name not in profiles:
+                return {"ok": False, "error": f"Unbekanntes Profil: {name}"}
+            values = profiles[name]["values"]
+        with self.device_lock:
+            if not self.ctrl.ensure_connected():
+                return {"ok": False, "error": "Keine Verbindung zum EPEVER"}
+            try:
+                result = apply_profile(self.ctrl, values, self.ctrl.max_block)
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}
+            except Exception:
+                self.ctrl.mark_failure()
+                return {"ok": False, "error": "Schreiben fehlgeschlagen"}
+            settings = self.ctrl.get_settings() if result.get("changed") else None
+            self.scheduler.reschedule("settings")
+        if settings:
+            self.data["settings"] = settings
+            if self.snapshot:
+                self.update_snapshot({**self.snapshot, "settings": settings})
+                self.notify_subscribers(self.snapshot, ["settings"])
+        return {**result, "profile": name}
+
+    def update_snapshot(self, data):
+        # Neue Version, jedes geaenderte Feld merkt sich die Version seiner letzten Aenderung
+        previous = self.snapshot or empty_snapshot()
+        self.version += 1
+        for group in SNAPSHOT_GROUPS:
+            for key, value in data.get(group, {}).items():
+                if previous.get(group, {}).get(key, self) != value:
+                    self.field_versions[group, key] = self.version
+        self.snapshot = {**data, "version": self.version}
+        self.snapshot_time = time.time()
+
+    def select(self, snapshot, since=None, fields=None):
+        # Snapshot auf geaenderte Felder (seit Version since) und/oder ausgewaehlte Felder reduzieren
+        if since is not None and since > snapshot["version"]:
+            since = None
+        data = dict(snapshot)
+        for group in SNAPSHOT_GROUPS:
+            data[group] = {key: value for key, value in snapshot.get(group, {}).items()
+                           if (fields is None or key in fields)
+                           and (since is None or self.field_versions.get((group, key), 0) > since)}
+        return data
+
+    def notify_subscribers(self, snapshot, groups):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(snapshot)
+            except queue.Full:
+                pass
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=10)
+        with self.subscribers_lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.subscribers_lock:
+            self.subscribers.discard(q)
+
+    def handle(self, req):
+        cmd = req.get("cmd")
+        if cmd == "get":
+            if self.snapshot is None:
+                return {"ok": False, "error": "Noch keine Daten"}
+            snapshot = self.snapshot
+            resp = {"ok": True, "version": snapshot["version"], "age": round(time.time() - self.snapshot_time, 3),
+                    "connection": self.ctrl.connection_stats()}
+            if req.get("known") != snapshot["version"]:
+                since, fields = req.get("since"), req.get("fields")
+                resp["data"] = snapshot if since is None and fields is None else self.select(snapshot, since, fields)
+            return resp
+        if cmd == "stats":
+            return {"ok": True, "connection": self.ctrl.connection_stats(), "scheduler": self.scheduler.stats()}
+        if cmd == "set":
+            return self.write_setting(int(req["register"]), int(req["value"]))
+        if cmd == "metrics":
+            return {"ok": True, "text": REGISTRY.render()}
+        if cmd == "apply_profile":
+            return self.write_profile(req.get("profile"), req.get("values"))
+        return {"ok": False, "error": f"Unbekannter Befehl: {cmd}"}
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            # Antwortet dort ein Poller, nicht uebernehmen: beide wuerden um die eine Modbus-Verbindung kaempfen
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(1)
+                    sock.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"Poller laeuft bereits ({self.socket_path})")
+        poller = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        req = json.loads(line)
+                        if req.get("cmd") == "subscribe":
+                            return self.stream()
+                        resp = poller.handle(req)
+                    except Exception as e:
+                        resp = {"ok": False, "error": str(e)}
+                    self.wfile.write(json.dumps(resp).encode() + b"\n")
+
+            def stream(self):
+                # Verbindung bleibt offen, jeder neue Snapshot wird sofort gesendet
+                q = poller.subscribe()
+                try:
+                    if poller.snapshot is not None:
+                        self.wfile.write(json.dumps({"ok": True, "data": poller.snapshot}).encode() + b"\n")
+                    while poller.running:
+                        try:
+                            snapshot = q.get(timeout=15)
+                            line = {"ok": True, "data": snapshot}
+                        except queue.Empty:
+                            line = {"ok": True, "keepalive": True}
+                        self.wfile.write(json.dumps(line).encode() + b"\n")
+                except OSError:
+                    pass
+                finally:
+                    poller.unsubscribe(q)
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self, *_):
+        self.running = False
+
+    def run(self):
+        self.running = True
+        self.serve()
+        try:
+            while self.running:
+                self.poll()
+                for group in self.scheduler.due():
+                    self.scheduler.skip(group)
+                self.scheduler.wait(lambda: self.running)
+        finally:
+            self.ctrl.disconnect()
+            self.server.shutdown()
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER Poller")
+    parser.add_argument("--interval", "-i", type=float, default=5, help="Interval Echtzeitdaten in Sekunden (default: 5)")
+    parser.add_argument("--stats-interval", type=float, default=60, help="Interval Statistiken in Sekunden (default: 60)")
+    parser.add_argument("--settings-interval", type=float, default=3600, help="Interval Einstellungen in Sekunden (default: 3600)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Echtzeit-Intervall an PV- und Lastaenderungen anpassen (ADAPTIVE_THRESHOLDS)")
+    parser.add_argument("--min-interval", type=float, default=2, help="Kuerzestes adaptives Interval (default: 2)")
+    parser.add_argument("--max-interval", type=float, default=60, help="Laengstes adaptives Interval (default: 60)")
+    parser.add_argument("--socket", default=POLLER_SOCKET, help="Pfad des Unix-Sockets")
+    parser.add_argument("--history", nargs="?", const=HISTORY_DB, metavar="DB", help="Messwerte in der Historie speichern")
+    args = parser.parse_args()
+
+    ctrl = EpeverController(EPEVER_HOST, EPEVER_PORT, SLAVE_ID)
+    scheduler = PollScheduler(poll_groups(args.interval, args.stats_interval, args.settings_interval))
+    adaptive = AdaptiveRate(scheduler, args.min_interval, args.max_interval) if args.adaptive else None
+    poller = EpeverPoller(ctrl, scheduler, args.socket, adaptive)
+    if args.history:
+        history = HistoryStore(args.history)
+
+        def store_history(snapshot, groups):
+            values = {}
+            for group in groups:
+                if group != "settings":
+                    values.update(snapshot[group])
+            # Abgeleitete Werte entstehen mit jeder Echtzeitabfrage, stehen aber nicht in groups
+            if "realtime" in groups:
+                values.update(snapshot.get("derived") or {})
+            # Abfrageintervall ist Scheduler-Verwaltung, kein Messwert
+            values.pop("poll_interval", None)
+            history.append(values)
+
+        poller.listeners.append(store_history)
+    signal.signal(signal.SIGINT, poller.stop)
+    signal.signal(signal.SIGTERM, poller.stop)
+
+    print(f"EPEVER Poller gestartet (Echtzeit: {args.interval}s, Statistik: {args.stats_interval}s, "
+          f"Einstellungen: {args.settings_interval}s)")
+    if adaptive:
+        print(f"Adaptiv: {args.min_interval}-{args.max_interval}s")
+    print(f"EPEVER: {EPEVER_HOST}:{EPEVER_PORT}")
+    print(f"Socket: {args.socket}")
+    if args.history:
+        print(f"Historie: {args.history}")
+    print()
+
+    try:
+        poller.run()
+    except RuntimeError as e:
+        print(f"FEHLER: {e}")
+        sys.exit(1)
+    print("Poller beendet")
+
+
+if __name__ == "__main__":
+    main()
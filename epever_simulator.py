@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+EPEVER Simulator - Laderegler und WiFi-Modul als lokaler Modbus-TCP-Server
+
+Der Laderegler ist ein pymodbus-Server mit der Registertabelle aus
+epever_controller.py und einem Tagesverlauf (Sonne, Last, Batterie). Davor
+sitzt ein Proxy, der sich wie das WiFi-Modul verhaelt (siehe NOTES.md):
+
+    - mehr als MAX_BLOCK_SIZE Register pro Abfrage -> leeres Array
+    - INVALID_REGISTERS und unbekannte Adressen -> Modbus-Exception
+    - Schreibbefehle bleiben ohne Antwort (--allow-writes schaltet das ab)
+    - einstellbare Latenz pro Anfrage, Anfragen werden nacheinander bearbeitet
+    - zufaellig abgebrochene Verbindungen (--drop-rate)
+    - nur eine TCP-Verbindung gleichzeitig, weitere werden sofort geschlossen
+
+    python epever_simulator.py                         # 127.0.0.1:8899
+    python epever_simulator.py --speed 60 --start 6    # 1 Minute pro Sekunde ab 6 Uhr
+    EPEVER_HOST=127.0.0.1 python epever_poller.py      # Gateway gegen den Simulator
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import struct
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pymodbus.server import ModbusTcpServer
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseSlaveContext
+from epever_core import REGISTER_MAP, MAX_BLOCK_SIZE, INVALID_REGISTERS
+from settings_profiles import profile_registers
+from register_codec import REGISTER_WIDTH
+
+SIM_HOST = os.environ.get('SIM_HOST', '127.0.0.1')
+SIM_PORT = int(os.environ.get('SIM_PORT', 8899))
+
+# Vom WiFi-Modul beantwortete Bereiche (NOTES.md), ohne INVALID_REGISTERS
+VALID_INPUTS = [(0x3000, 0x3010), (0x3100, 0x3113), (0x311A, 0x311D), (0x3200, 0x3202), (0x3300, 0x3316)]
+VALID_HOLDINGS = [(0x9000, 0x901F), (0x903D, 0x904D)]
+
+WRITE_FUNCTIONS = {5, 6, 15, 16}
+
+# Anlage: 12-V-LiFePO4, 100 Ah, 400 Wp
+BATTERY_WH = 1280
+PV_PEAK_W = 400
+MAX_CHARGE_A = 30
+
+# Nenndaten (DEVICE_INFO_INPUTS): 100 V PV, 30 A
+RATED_INPUTS = {0x3000: 10000, 0x3004: 3000}
+
+# Einstellungen des simulierten Geraets (wie ein Profil in settings_profiles.py)
+DEFAULT_SETTINGS = {
+    "bat_type": "Sealed", "bat_capacity": 100, "temp_comp": 3,
+    "high_volt_disconnect": 16.0, "charging_limit_volt": 15.0, "over_volt_reconnect": 15.0,
+    "equalize_volt": 14.6, "boost_volt": 14.4, "float_volt": 13.8, "low_volt_disconnect": 11.1,
+    "under_volt_warning": 12.0, "low_volt_reconnect": 12.6, "boost_reconnect_volt": 13.2,
+    "boost_duration": 120, "equalize_duration": 120, "load_mode": "Manual",
+    "light_on_delay": 10, "light_off_delay": 10, "load_timer1": 0,
+}
+
+
+def encode(value, factor, dtype):
+    # Zweierkomplement fuer s16/s32, z.B. Batterietemperatur unter 0 °C
+    raw = int(round(value / factor)) & 0xFFFFFFFF
+    if REGISTER_WIDTH[dtype] == 2:
+        return [raw & 0xFFFF, raw >> 16]
+    return [raw & 0xFFFF]
+
+
+class SolarDay:
+    """Tagesverlauf: Einstrahlung mit Wolken, Last, Batterie-SOC und Tageszaehler"""
+
+    def __init__(self, speed=1.0, start_hour=None, seed=1):
+        self.speed = speed
+        self.rng = random.Random(seed)
+        now = time.time()
+        local = time.localtime(now)
+        day_start = now - (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec)
+        self.origin = now
+        self.sim_origin = day_start + start_hour * 3600 if start_hour is not None else now
+        self.sim_time = self.sim_origin
+        self.soc = 0.6
+        self.day = None
+        self.values = {}
+        self.totals = {"generation_total": 812.4, "consumption_total": 301.7}
+        self.step(0)
+
+    def clock(self):
+        return self.sim_origin + (time.time() - self.origin) * self.speed
+
+    def irradiance(self, t):
+        hour = (t % 86400) / 3600
+        if not 6 <= hour <= 20:
+            return 0.0
+        sun = math.sin(math.pi * (hour - 6) / 14) ** 1.5
+        clouds = 1 - 0.35 * max(0.0, math.sin(t / 900) * math.sin(t / 2300 + 1))
+        return sun * clouds
+
+    def load(self, t):
+        hour = (t % 86400) / 3600
+        return 12.0 + (45.0 if 18 <= hour < 23 else 0.0) + (25.0 if 7 <= hour < 8 else 0.0)
+
+    def update(self):
+        now = self.clock()
+        while self.sim_time < now:
+            dt = min(60.0, now - self.sim_time)
+            self.sim_time += dt
+            self.step(dt)
+        return self.values
+
+    def step(self, dt):
+        t = self.sim_time
+        day = time.strftime("%Y-%m-%d", time.localtime(t))
+        if day != self.day:
+            self.day = day
+            self.today = {"generation_today": 0.0, "consumption_today": 0.0,
+                          "pv_max_today": 0.0, "bat_min_today": None, "bat_max_today": 0.0}
+        irr = self.irradiance(t)
+        pv_power = PV_PEAK_W * irr * self.rng.uniform(0.97, 1.0) if irr > 0 else 0.0
+        bat_voltage = 12.4 + 1.0 * self.soc
+        load_power = self.load(t) if self.soc > 0.05 else 0.0
+        charge_power = min(pv_power * 0.96, MAX_CHARGE_A * bat_voltage)
+        state = 2 if charge_power > 0 else 0
+        if self.soc >= 0.995:
+            charge_power, state = min(charge_power, load_power), 5
+        self.soc = min(1.0, max(0.0, self.soc + (charge_power - load_power) * dt / 3600 / BATTERY_WH))
+        bat_voltage += 0.4 * charge_power / (MAX_CHARGE_A * bat_voltage)
+        pv_voltage = 34.0 + 4.0 * irr if irr > 0 else 0.0
+
+        self.today["generation_today"] += charge_power * dt / 3.6e6
+        self.today["consumption_today"] += load_power * dt / 3.6e6
+        self.totals["generation_total"] += charge_power * dt / 3.6e6
+        self.totals["consumption_total"] += load_power * dt / 3.6e6
+        self.today["pv_max_today"] = max(self.today["pv_max_today"], pv_voltage)
+        self.today["bat_max_today"] = max(self.today["bat_max_today"], bat_voltage)
+        self.today["bat_min_today"] = min(self.today["bat_min_today"] or bat_voltage, bat_voltage)
+
+        hour = (t % 86400) / 3600
+        self.values = {
+            "pv_voltage": pv_voltage,
+            "pv_current": pv_power / pv_voltage if pv_voltage else 0.0,
+            "pv_power": pv_power,
+            "bat_voltage": bat_voltage,
+            "charge_current": charge_power / bat_voltage,
+            "charge_power": charge_power,
+            "load_voltage": bat_voltage,
+            "load_current": load_power / bat_voltage,
+            "load_power": load_power,
+            "bat_temp": 8.0 + 10.0 * math.sin(math.pi * (hour - 8) / 12),
+            "dev_temp": 15.0 + charge_power / 25.0,
+            "bat_soc": round(self.soc * 100),
+            "bat_soh": 100,
+            "charging_state": state,
+            **self.today,
+            **self.totals,
+        }
+
+
+class EpeverDeviceContext(ModbusBaseSlaveContext):
+    """Register des Ladereglers, Eingangsregister werden bei jeder Abfrage neu berechnet"""
+
+    def __init__(self, day, max_block=MAX_BLOCK_SIZE):
+        self.day = day
+        self.max_block = max_block
+        self.inputs = {addr: 0 for lo, hi in VALID_INPUTS for addr in range(lo, hi + 1)}
+        self.holdings = {addr: 0 for lo, hi in VALID_HOLDINGS for addr in range(lo, hi + 1)}
+        self.holdings.update(profile_registers(DEFAULT_SETTINGS))
+        self.inputs.update(RATED_INPUTS)
+        for addr in INVALID_REGISTERS:
+            self.inputs.pop(addr, None)
+            self.holdings.pop(addr, None)
+        self.input_map = [(addr, sid, dtype, factor) for addr, sid, kind, dtype, factor, _, _ in REGISTER_MAP
+                          if kind == "input"]
+        self.input_map += [(0x311B, "bat_soh", "u16", 1), (0x311D, "charging_state", "u16", 1)]
+        self.writes = 0
+
+    def reset(self):
+        pass
+
+    def table(self, fc):
+        return self.holdings if self.decode(fc) == "h" else self.inputs
+
+    def refresh(self):
+        values = self.day.update()
+        for addr, sid, dtype, factor in self.input_map:
+            if sid in values and addr in self.inputs:
+                for i, raw in enumerate(encode(values[sid], factor, dtype)):
+                    self.inputs[addr + i] = raw
+        self.inputs[0x3201] = values["charging_state"] << 2 | 1
+
+    def validate(self, fc, address, count=1):
+        if self.decode(fc) not in ("h", "i"):
+            return False
+        if count > self.max_block and fc in (3, 4):
+            # Puffer des WiFi-Moduls zu klein: Antwort ohne Register
+            return True
+        table = self.table(fc)
+        return all(addr in table for addr in range(address, address + count))
+
+    def getValues(self, fc, address, count=1):
+        if count > self.max_block:
+            return []
+        if self.decode(fc) == "i":
+            self.refresh()
+        table = self.table(fc)
+        return [table[addr] for addr in range(address, address + count)]
+
+    def setValues(self, fc, address, values):
+        self.writes += 1
+        for i, value in enumerate(values):
+            self.holdings[address + i] = int(value)
+
+
+class WifiBridge:
+    """TCP-Proxy vor dem pymodbus-Server mit dem Verhalten des WiFi-Moduls"""
+
+    def __init__(self, target, latency=0.05, jitter=0.02, drop_rate=0.0, allow_writes=False, max_connections=1,
+                 seed=1):
+        self.target = target
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.allow_writes = allow_writes
+        self.max_connections = max_connections
+        self.rng = random.Random(seed)
+        self.bus = asyncio.Lock()
+        self.connections = 0
+        self.stats = {"connections": 0, "rejected": 0, "requests": 0, "dropped": 0, "ignored_writes": 0,
+                      "bytes_in": 0, "bytes_out": 0}
+
+    async def handle(self, reader, writer):
+        if self.connections >= self.max_connections:
+            self.stats["rejected"] += 1
+            writer.close()
+            return
+        self.connections += 1
+        self.stats["connections"] += 1
+        up_reader, up_writer = await asyncio.open_connection(*self.target)
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                length = struct.unpack(">H", header[4:6])[0]
+                frame = header + await reader.readexactly(length - 1)
+                self.stats["requests"] += 1
+                self.stats["bytes_in"] += len(frame)
+                async with self.bus:
+                    await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+                    if self.rng.random() < self.drop_rate:
+                        self.stats["dropped"] += 1
+                        break
+                    if frame[7] in WRITE_FUNCTIONS and not self.allow_writes:
+                        # Wie das echte Modul: keine Antwort, der Client laeuft in den Timeout
+                        self.stats["ignored_writes"] += 1
+                        continue
+                    up_writer.write(frame)
+                    await up_writer.drain()
+                    resp = await up_reader.readexactly(7)
+                    resp += await up_reader.readexactly(struct.unpack(">H", resp[4:6])[0] - 1)
+                self.stats["bytes_out"] += len(resp)
+                writer.write(resp)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            up_writer.close()
+            writer.close()
+
+
+class Simulator:
+    def __init__(self, host=SIM_HOST, port=SIM_PORT, speed=1.0, start_hour=None, max_block=MAX_BLOCK_SIZE,
+                 **bridge_options):
+        self.host = host
+        self.port = port
+        self.day = SolarDay(speed, start_hour)
+        self.device = EpeverDeviceContext(self.day, max_block)
+        self.bridge_options = bridge_options
+        self.bridge = None
+        self.loop = None
+        self.ready = threading.Event()
+
+    async def serve(self):
+        server = ModbusTcpServer(ModbusServerContext(slaves=self.device, single=True), address=("127.0.0.1", 0))
+        await server.listen()
+        device_port = server.transport.sockets[0].getsockname()[1]
+        self.bridge = WifiBridge(("127.0.0.1", device_port), **self.bridge_options)
+        proxy = await asyncio.start_server(self.bridge.handle, self.host, self.port)
+        self.port = proxy.sockets[0].getsockname()[1]
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.ready.set()
+        async with proxy:
+            await self.stopped.wait()
+        await server.shutdown()
+
+    def start(self):
+        # Im Hintergrund-Thread starten, z.B. fuer Benchmarks; liefert (host, port)
+        threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True).start()
+        self.ready.wait(5)
+        return self.host, self.port
+
+    def stop(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER Simulator (Laderegler + WiFi-Modul)")
+    parser.add_argument("--host", default=SIM_HOST, help="Adresse (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=SIM_PORT, help="Port (default: 8899)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Zeitraffer-Faktor (default: 1)")
+    parser.add_argument("--start", type=float, metavar="STUNDE", help="Simulierte Uhrzeit beim Start (z.B. 6)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latenz pro Anfrage in Sekunden (default: 0.05)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Zufaellige Abweichung der Latenz")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Anteil abgebrochener Anfragen (z.B. 0.01)")
+    parser.add_argument("--max-block", type=int, default=MAX_BLOCK_SIZE, help="Max. Register pro Abfrage")
+    parser.add_argument("--max-connections", type=int, default=1, help="Gleichzeitige Verbindungen (default: 1)")
+    parser.add_argument("--allow-writes", action="store_true", help="Schreibbefehle annehmen (RS485-Adapter)")
+    args = parser.parse_args()
+
+    sim = Simulator(args.host, args.port, args.speed, args.start, args.max_block, latency=args.latency,
+                    jitter=args.jitter, drop_rate=args.drop_rate, allow_writes=args.allow_writes,
+                    max_connections=args.max_connections)
+    print(f"EPEVER Simulator auf {args.host}:{args.port} (Zeitraffer {args.speed}x, Latenz {args.latency}s, "
+          f"max. {args.max_block} Register, Schreiben {'an' if args.allow_writes else 'aus'})")
+    try:
+        asyncio.run(sim.serve())
+    except KeyboardInterrupt:
+        pass
+    print(f"Simulator beendet: {sim.bridge.stats if sim.bridge else {}}")
+
+
+if __name__ == "__main__":
+    main()
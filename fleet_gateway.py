@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+EPEVER Fleet Gateway - mehrere Laderegler ueber ein Gateway
+
+Liest alle Geraete aus einer Fleet-Konfiguration (siehe fleet.example.json)
+und sendet sie mit eigenen Discovery- und State-Topics an Home Assistant:
+    python fleet_gateway.py --config fleet.json
+
+Geraete hinter verschiedenen WiFi-Modulen werden parallel abgefragt, Geraete
+am selben Modul (gleicher RS485-Bus, unterschiedliche Slave-IDs) nacheinander
+ueber eine gemeinsame Verbindung. Die Zykluszeit waechst damit nur mit der
+Anzahl Geraete pro Modul, nicht mit der Gesamtzahl.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from datetime import datetime
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epever_async import AsyncEpeverController, poll_due_async, transport_error
+from poll_scheduler import PollScheduler, poll_groups, empty_snapshot
+from mqtt_publisher import MqttPublisher
+from ha_discovery import DiscoveryPublisher
+from payload_codec import PayloadEncoder, PAYLOAD_ENCODING
+from epever_core import REGISTER_MAP, backoff_delay
+from mqtt_service import (MQTT_SERVER, MQTT_PORT, MQTT_USER, MQTT_PASS, MQTT_QOS, DISCOVERY_PREFIX,
+                          DISCOVERY_MODE, STATE_FIELDS, METRICS_PORT, discovery_components, check_payload_encoding)
+import metrics
+
+FLEET_CONFIG = os.environ.get('FLEET_CONFIG', 'fleet.json')
+
+# Felder, die publish() tatsaechlich sendet; Discovery nur fuer diese (keine abgeleiteten Werte, kein poll_interval)
+FLEET_FIELDS = {entry[1] for entry in REGISTER_MAP} | {"last_update"}
+
+
+class FleetDevice:
+    def __init__(self, conf, intervals):
+        self.host = conf["host"]
+        self.port = int(conf.get("port", 8899))
+        self.slave = int(conf.get("slave", 1))
+        self.device_id = conf["device_id"]
+        self.model = conf.get("model", "XTRA-N")
+        self.name = conf.get("name", f"EPEVER {self.model}")
+        self.scheduler = PollScheduler(poll_groups(**intervals))
+        # Backoff pro Slave: ein stummer Slave am gemeinsamen Bus bremst die anderen nicht aus
+        self.failures = 0
+        self.next_attempt = 0
+        self.data = empty_snapshot()
+        self.discovery = None
+        self.encoder = PayloadEncoder(PAYLOAD_ENCODING, STATE_FIELDS)
+
+    def device_info(self):
+        return {
+            "identifiers": [self.device_id],
+            "name": self.name,
+            "model": self.model.split()[0],
+            "manufacturer": "EPEVER"
+        }
+
+
+def load_fleet(path):
+    with open(path) as f:
+        conf = json.load(f)
+    intervals = conf.get("intervals", {})
+    return [FleetDevice(d, intervals) for d in conf["devices"]]
+
+
+class FleetGateway:
+    def __init__(self, devices, publisher):
+        self.devices = devices
+        self.publisher = publisher
+        self.running = True
+        self.bridges = defaultdict(list)
+        for dev in devices:
+            self.bridges[(dev.host, dev.port)].append(dev)
+
+    def attach_discovery(self):
+        if DISCOVERY_MODE == "off":
+            return
+        for dev in self.devices:
+            dev.discovery = DiscoveryPublisher(self.publisher, dev.device_id, dev.device_info(),
+                                               discovery_components(dev.device_id, FLEET_FIELDS, False, "full"),
+                                               DISCOVERY_PREFIX, DISCOVERY_MODE)
+            dev.discovery.attach()
+
+    def publish(self, dev):
+        payload = {
+            **dev.data["realtime"],
+            **dev.data["statistics"],
+            **dev.data["settings"],
+            "last_sync": dev.data["last_update"],
+            "last_update": datetime.now().isoformat()
+        }
+        body = dev.encoder.encode(payload)
+        schema = dev.encoder.schema_message()
+        if schema:
+            self.publisher.publish(f"{dev.device_id}/schema", schema, qos=MQTT_QOS, retain=True)
+        self.publisher.publish(f"{dev.device_id}/state", body, qos=MQTT_QOS)
+
+    async def run_bridge(self, host, port, devices):
+        # Eine Verbindung pro WiFi-Modul, Geraete am selben Bus nacheinander
+        ctrl = AsyncEpeverController(host, port)
+        was_online = None
+        while self.running:
+            online = await ctrl.ensure_connected()
+            if online != was_online:
+                state = "verbunden" if online else "nicht erreichbar"
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {host}:{port} {state} "
+                      f"({', '.join(d.device_id for d in devices)})", flush=True)
+                was_online = online
+            for dev in devices:
+                if online and not ctrl.is_connected():
+                    # Timeout beim vorigen Slave schliesst die Verbindung, fuer den naechsten neu aufbauen
+                    online = await ctrl.ensure_connected()
+                if online and ctrl.is_connected() and time.monotonic() >= dev.next_attempt:
+                    await self.poll_device(ctrl, dev)
+                for group in dev.scheduler.due():
+                    dev.scheduler.skip(group)
+            await self.wait(devices)
+        ctrl.disconnect()
+
+    async def poll_device(self, ctrl, dev):
+        ctrl.slave_id = dev.slave
+        due = dev.scheduler.due()
+        try:
+            ran = await poll_due_async(ctrl, dev.scheduler, dev.data, per_slave=True)
+        except Exception as e:
+            # Fehler bleibt bei diesem Geraet bzw. Modul, die anderen Bruecken laufen weiter
+            if transport_error(e):
+                ctrl.mark_failure()
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {dev.device_id}: Fehler {e}", flush=True)
+            ran = []
+        if ran:
+            if dev.failures:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {dev.device_id}: antwortet wieder", flush=True)
+            dev.failures, dev.next_attempt = 0, 0
+            if dev.data["realtime"]:
+                self.publish(dev)
+        elif due and not ctrl.failures:
+            # Kein Verbindungsfehler, nur dieser Slave antwortet nicht (leer, Modbus-Fehler, Timeout): nur ihn zurueckstellen
+            dev.failures += 1
+            dev.next_attempt = time.monotonic() + backoff_delay(dev.failures)
+            if dev.failures == 1:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {dev.device_id} (Slave {dev.slave}) antwortet nicht",
+                      flush=True)
+
+    async def wait(self, devices):
+        clock = devices[0].scheduler.clock
+        while self.running:
+            remaining = min(d.scheduler.next_deadline() for d in devices) - clock()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(0.5, remaining))
+
+    def stop(self, *_):
+        self.running = False
+
+    async def run(self):
+        await asyncio.gather(*(self.run_bridge(host, port, devs) for (host, port), devs in self.bridges.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER Fleet Gateway")
+    parser.add_argument("--config", "-c", default=FLEET_CONFIG, help="Fleet-Konfiguration (JSON)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Prometheus /metrics auf diesem Port")
+    args = parser.parse_args()
+
+    try:
+        check_payload_encoding(field_topics=False)
+    except RuntimeError as e:
+        print(f"FEHLER: {e}")
+        sys.exit(1)
+    devices = load_fleet(args.config)
+    publisher = MqttPublisher(MQTT_SERVER, MQTT_PORT, MQTT_USER, MQTT_PASS).start()
+    gateway = FleetGateway(devices, publisher)
+    signal.signal(signal.SIGINT, gateway.stop)
+    signal.signal(signal.SIGTERM, gateway.stop)
+
+    print(f"EPEVER Fleet Gateway gestartet ({len(devices)} Geraete an {len(gateway.bridges)} WiFi-Modulen)")
+    print(f"MQTT: {MQTT_SERVER}:{MQTT_PORT}")
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+        print(f"Metriken: http://0.0.0.0:{args.metrics_port}/metrics")
+    print()
+
+    gateway.attach_discovery()
+    asyncio.run(gateway.run())
+    publisher.stop()
+    print("Fleet Gateway beendet")
+
+
+if __name__ == "__main__":
+    main()
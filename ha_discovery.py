@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Home Assistant MQTT Discovery
+
+Sendet die Discovery-Konfiguration nur beim Start und wenn Home Assistant
+ueber `homeassistant/status` "online" meldet. Ein Hash pro Topic verhindert,
+dass unveraenderte Konfigurationen erneut als Retained-Nachricht gesendet
+werden.
+
+Modi:
+    entity  - ein Topic pro Sensor: homeassistant/sensor/<device>/<id>/config
+    device  - ein Topic fuer das ganze Geraet: homeassistant/device/<device>/config
+"""
+
+import json
+import hashlib
+
+ORIGIN = {"name": "epever-solar-gateway", "url": "https://github.com/Frank-Jettenbach/epever-solar-gateway"}
+
+
+def sensor_config(device_id, sid, name, unit=None, device_class=None, state_class=None,
+                  entity_category=None, state_topic=None):
+    config = {
+        "name": name,
+        "state_topic": state_topic or f"{device_id}/state",
+        "value_template": f"{{{{ value_json.{sid} }}}}",
+        "unique_id": f"{device_id}_{sid}",
+    }
+    if unit:
+        config["unit_of_measurement"] = unit
+    if device_class:
+        config["device_class"] = device_class
+    if state_class:
+        config["state_class"] = state_class
+    if entity_category:
+        config["entity_category"] = entity_category
+    return config
+
+
+class DiscoveryPublisher:
+    def __init__(self, publisher, device_id, device_info, components, prefix="homeassistant", mode="entity",
+                 sent=None):
+        self.publisher = publisher
+        self.device_id = device_id
+        self.device_info = device_info
+        self.components = components
+        self.prefix = prefix
+        self.mode = mode
+        self.sent = sent if sent is not None else {}
+
+    def messages(self):
+        if self.mode == "device":
+            payload = {
+                "device": self.device_info,
+                "origin": ORIGIN,
+                "components": {sid: {"platform": "sensor", **config} for sid, config in self.components},
+            }
+            return {f"{self.prefix}/device/{self.device_id}/config": payload}
+        return {
+            f"{self.prefix}/sensor/{self.device_id}/{sid}/config": {**config, "device": self.device_info}
+            for sid, config in self.components
+        }
+
+    def publish(self, force=False):
+        count = 0
+        for topic, payload in self.messages().items():
+            body = json.dumps(payload, sort_keys=True)
+            digest = hashlib.sha1(body.encode()).hexdigest()
+            if not force and self.sent.get(topic) == digest:
+                continue
+            self.publisher.publish(topic, body, retain=True)
+            self.sent[topic] = digest
+            count += 1
+        return count
+
+    def on_ha_status(self, topic, payload):
+        if payload.decode(errors="ignore").strip() == "online":
+            self.publish(force=True)
+
+    def attach(self):
+        # Discovery beim Start senden und bei jedem HA-Neustart wiederholen
+        self.publisher.subscribe(f"{self.prefix}/status", self.on_ha_status)
+        return self.publish()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Lokaler Zeitreihen-Speicher fuer Messwerte (SQLite)
+
+Jede Abfrage wird als Rohwert gespeichert und gleichzeitig in 1-Minuten- und
+1-Stunden-Aggregate (min/max/avg) eingerechnet. Jede Stufe hat ihre eigene
+Aufbewahrungsdauer. Abfragen nutzen automatisch die guenstigste Stufe fuer die
+gewuenschte Aufloesung.
+
+    python history_store.py --field pv_power --step 3600   # Letzte 24h stuendlich
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+HISTORY_DB = os.environ.get('HISTORY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.db'))
+
+# (Stufe, Aufloesung in s, Aufbewahrung in s)
+TIERS = [
+    ("raw", 1, 2 * 86400),
+    ("1m", 60, 30 * 86400),
+    ("1h", 3600, 5 * 365 * 86400),
+]
+
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fields (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS raw (
+    field INTEGER NOT NULL, ts INTEGER NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (field, ts)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1m (
+    field INTEGER NOT NULL, ts INTEGER NOT NULL, min REAL, max REAL, sum REAL, count INTEGER,
+    PRIMARY KEY (field, ts)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1h (
+    field INTEGER NOT NULL, ts INTEGER NOT NULL, min REAL, max REAL, sum REAL, count INTEGER,
+    PRIMARY KEY (field, ts)) WITHOUT ROWID;
+"""
+
+ROLLUP_SQL = """
+INSERT INTO {table} (field, ts, min, max, sum, count) VALUES (?, ?, ?, ?, ?, 1)
+ON CONFLICT (field, ts) DO UPDATE SET
+    min = MIN(min, excluded.min), max = MAX(max, excluded.max),
+    sum = sum + excluded.sum, count = count + 1
+"""
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_DB, readonly=False):
+        self.path = path
+        if readonly:
+            self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.executescript(SCHEMA)
+        self.field_ids = dict(self.db.execute("SELECT name, id FROM fields"))
+        self.last_prune = 0
+
+    def field_id(self, name):
+        if name not in self.field_ids:
+            cur = self.db.execute("INSERT OR IGNORE INTO fields (name) VALUES (?)", (name,))
+            self.field_ids[name] = cur.lastrowid or self.db.execute(
+                "SELECT id FROM fields WHERE name = ?", (name,)).fetchone()[0]
+        return self.field_ids[name]
+
+    def append(self, values, ts=None):
+        ts = int(time.time() if ts is None else ts)
+        rows = [(self.field_id(k), v) for k, v in values.items()
+                if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        with self.db:
+            # Zweiter Wert in derselben Sekunde wird verworfen, sonst zaehlten die Aggregate ihn doppelt
+            rows = [(f, v) for f, v in rows
+                    if self.db.execute("INSERT OR IGNORE INTO raw (field, ts, value) VALUES (?, ?, ?)",
+                                       (f, ts, v)).rowcount]
+            for table, size in (("rollup_1m", 60), ("rollup_1h", 3600)):
+                bucket = ts - ts % size
+                self.db.executemany(ROLLUP_SQL.format(table=table), [(f, bucket, v, v, v) for f, v in rows])
+        if ts - self.last_prune >= PRUNE_INTERVAL:
+            self.prune(ts)
+
+    def prune(self, now=None):
+        now = int(time.time() if now is None else now)
+        with self.db:
+            for (_, _, retention), table in zip(TIERS, ("raw", "rollup_1m", "rollup_1h")):
+                self.db.execute(f"DELETE FROM {table} WHERE ts < ?", (now - retention,))
+        self.last_prune = now
+
+    def resolve(self, start, step=None, now=None):
+        """(Stufe, Bucketgroesse, Schrittweite) fuer eine Abfrage ab start
+
+        Groebste Stufe, die step aufloest, aber mindestens die feinste, deren
+        Aufbewahrung start noch enthaelt; step wird auf ein Vielfaches der Bucketgroesse aufgerundet.
+        """
+        now = time.time() if now is None else now
+        step = max(1, int(step or 1))
+        by_step = max(i for i, (_, size, _) in enumerate(TIERS) if size <= step)
+        by_age = next((i for i, (_, _, retention) in enumerate(TIERS) if now - retention <= start), len(TIERS) - 1)
+        name, size, _ = TIERS[max(by_step, by_age)]
+        return name, size, -(-step // size) * size
+
+    def query(self, field, start, end, step=None):
+        # Liefert (ts, min, max, avg) je Schritt, aus der groebsten Stufe, die fein genug ist und start noch enthaelt
+        if field not in self.field_ids:
+            self.field_ids = dict(self.db.execute("SELECT name, id FROM fields"))
+        fid = self.field_ids.get(field)
+        if fid is None:
+            return
+        tier, size, step = self.resolve(start, step)
+        if tier == "raw":
+            table, cols = "raw", "MIN(value), MAX(value), AVG(value)"
+        else:
+            table, cols = f"rollup_{tier}", "MIN(min), MAX(max), SUM(sum) / SUM(count)"
+        start = int(start) - int(start) % size
+        sql = (f"SELECT ts - ts % ? AS bucket, {cols} FROM {table} "
+               f"WHERE field = ? AND ts >= ? AND ts < ? GROUP BY bucket ORDER BY bucket")
+        yield from self.db.execute(sql, (step, fid, start, int(end)))
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER Messwert-Historie")
+    parser.add_argument("--db", default=HISTORY_DB, help="Pfad der Datenbank")
+    parser.add_argument("--field", required=True, help="Feld, z.B. pv_power")
+    parser.add_argument("--hours", type=float, default=24, help="Zeitraum in Stunden (default: 24)")
+    parser.add_argument("--step", type=int, default=3600, help="Schrittweite in Sekunden (default: 3600)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"FEHLER: {args.db} nicht gefunden")
+        sys.exit(1)
+    store = HistoryStore(args.db, readonly=True)
+    end = time.time()
+    for ts, vmin, vmax, vavg in store.query(args.field, end - args.hours * 3600, end, args.step):
+        print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))}  "
+              f"min {vmin:10.2f}  max {vmax:10.2f}  avg {vavg:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Zwischenspeicher fuer MQTT-Ausfaelle (Store-and-Forward, SQLite)
+
+Ist der Broker nicht erreichbar, landen die Nachrichten eines Zyklus als ein
+Eintrag mit dem Zeitpunkt der Abfrage auf der Platte statt verloren zu gehen.
+Nach dem Reconnect werden sie in Reihenfolge und unveraendert (also mit den
+urspruenglichen Zeitstempeln im Payload) erneut gesendet, gedrosselt auf
+MQTT_BUFFER_RATE Eintraege pro Sekunde. Ein Eintrag wird erst geloescht, wenn
+der Broker alle seine Nachrichten bestaetigt hat.
+
+Begrenzung: hoechstens MQTT_BUFFER_MAX Eintraege und MQTT_BUFFER_MAX_AGE
+Sekunden, aeltere Eintraege werden zuerst verworfen.
+
+    python mqtt_buffer.py              # Inhalt anzeigen
+    python mqtt_buffer.py --clear      # Puffer leeren
+"""
+
+import os
+import json
+import time
+import base64
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+from metrics import Counter, Gauge
+
+MQTT_BUFFER_DB = os.environ.get('MQTT_BUFFER_DB',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mqtt_buffer.db'))
+MQTT_BUFFER_MAX = int(os.environ.get('MQTT_BUFFER_MAX', 20000))
+MQTT_BUFFER_MAX_AGE = int(os.environ.get('MQTT_BUFFER_MAX_AGE', 7 * 86400))
+MQTT_BUFFER_RATE = float(os.environ.get('MQTT_BUFFER_RATE', 5))
+
+BUFFER_DEPTH = Gauge("epever_mqtt_buffer_depth", "Zyklen im Ausfall-Puffer (noch nicht gesendet)")
+BUFFER_EVENTS = Counter("epever_mqtt_buffer_events_total", "Ausfall-Puffer: gepuffert, nachgesendet, verworfen",
+                        ["event"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, messages TEXT NOT NULL);
+"""
+
+
+def dump_messages(messages):
+    # Binaere Payloads (msgpack/cbor) base64-kodiert ablegen
+    return json.dumps([(topic, {"base64": base64.b64encode(body).decode()} if isinstance(body, bytes) else body,
+                        retain) for topic, body, retain in messages])
+
+
+def load_messages(text):
+    return [(topic, base64.b64decode(body["base64"]) if isinstance(body, dict) else body, retain)
+            for topic, body, retain in json.loads(text)]
+
+
+class OutageBuffer:
+    def __init__(self, path=MQTT_BUFFER_DB, max_entries=MQTT_BUFFER_MAX, max_age=MQTT_BUFFER_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.size = self.db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+        BUFFER_DEPTH.set(self.size)
+
+    def depth(self):
+        return self.size
+
+    def append(self, messages, ts=None):
+        # messages: [(Topic, Payload, Retain), ...] eines Zyklus
+        ts = time.time() if ts is None else ts
+        with self.lock, self.db:
+            self.db.execute("INSERT INTO pending (ts, messages) VALUES (?, ?)", (ts, dump_messages(messages)))
+            self.size += 1
+            BUFFER_EVENTS.inc(event="buffered")
+            self._evict(ts)
+
+    def _evict(self, now):
+        evicted = self.db.execute("DELETE FROM pending WHERE ts < ?", (now - self.max_age,)).rowcount
+        if self.size - evicted > self.max_entries:
+            evicted += self.db.execute(
+                "DELETE FROM pending WHERE id IN (SELECT id FROM pending ORDER BY id LIMIT ?)",
+                (self.size - evicted - self.max_entries,)).rowcount
+        if evicted:
+            BUFFER_EVENTS.inc(evicted, event="evicted")
+        self.size -= evicted
+        BUFFER_DEPTH.set(self.size)
+
+    def oldest(self):
+        with self.lock:
+            row = self.db.execute("SELECT id, ts, messages FROM pending ORDER BY id LIMIT 1").fetchone()
+        return (row[0], row[1], load_messages(row[2])) if row else None
+
+    def remove(self, entry_id):
+        with self.lock, self.db:
+            removed = self.db.execute("DELETE FROM pending WHERE id = ?", (entry_id,)).rowcount
+            self.size -= removed
+            BUFFER_DEPTH.set(self.size)
+        return removed
+
+    def entries(self):
+        with self.lock:
+            return self.db.execute("SELECT id, ts, length(messages) FROM pending ORDER BY id").fetchall()
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM pending")
+            self.size = 0
+            BUFFER_DEPTH.set(0)
+
+    def close(self):
+        self.db.close()
+
+
+class Replayer:
+    """Sendet gepufferte Zyklen nach, sobald der Publisher verbunden ist"""
+
+    def __init__(self, buffer, publisher, qos=1, rate=MQTT_BUFFER_RATE, ack_timeout=30):
+        self.buffer = buffer
+        self.publisher = publisher
+        self.qos = qos
+        self.rate = rate
+        self.ack_timeout = ack_timeout
+        self.running = False
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(1)
+            self.wakeup.clear()
+            while self.running and self.buffer.depth() and self.publisher.connected.is_set():
+                if not self.replay_one():
+                    break
+                time.sleep(1 / self.rate if self.rate > 0 else 0)
+
+    def replay_one(self):
+        entry = self.buffer.oldest()
+        if entry is None:
+            return False
+        entry_id, ts, messages = entry
+        for topic, payload, retain in messages:
+            self.publisher.publish(topic, payload, qos=self.qos, retain=retain)
+        # Erst nach dem PUBACK loeschen, sonst ginge der Eintrag bei einem erneuten Ausfall verloren
+        if not self.publisher.flush(self.ack_timeout) or not self.publisher.connected.is_set():
+            return False
+        self.buffer.remove(entry_id)
+        BUFFER_EVENTS.inc(event="replayed")
+        if not self.buffer.depth():
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] MQTT-Puffer nachgesendet "
+                  f"(letzter Stand vom {datetime.fromtimestamp(ts).strftime('%d.%m. %H:%M:%S')})", flush=True)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPEVER MQTT-Ausfallpuffer")
+    parser.add_argument("--db", default=MQTT_BUFFER_DB, help="Pfad zur Puffer-Datenbank")
+    parser.add_argument("--clear", action="store_true", help="Alle gepufferten Zyklen verwerfen")
+    args = parser.parse_args()
+
+    buffer = OutageBuffer(args.db)
+    if args.clear:
+        print(f"{buffer.depth()} Zyklen verworfen")
+        buffer.clear()
+        return
+    entries = buffer.entries()
+    print(f"{len(entries)} Zyklen im Puffer ({args.db})")
+    if entries:
+        fmt = lambda ts: datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"  aeltester: {fmt(entries[0][1])}")
+        print(f"  neuester:  {fmt(entries[-1][1])}")
+        print(f"  Groesse:   {sum(e[2] for e in entries)} Bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Dauerhafter MQTT-Publisher fuer Gateway und Services
+
+Eine Verbindung fuer die gesamte Laufzeit, Netzwerk-Loop im Hintergrund
+(loop_start), begrenzte Sendewarteschlange, einstellbares QoS1-Fenster
+(In-Flight) und Auswertung der PUBACK-Latenzen.
+"""
+
+import time
+import queue
+import threading
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from metrics import Counter, Gauge, Histogram
+
+MQTT_EVENTS = Counter("epever_mqtt_events_total", "MQTT-Nachrichten und Verbindungsereignisse", ["event"])
+MQTT_ACK_LATENCY = Histogram("epever_mqtt_publish_ack_seconds", "Zeit von publish() bis PUBACK (QoS 1)")
+MQTT_QUEUE_DEPTH = Gauge("epever_mqtt_queue_depth", "Nachrichten in der Sendewarteschlange")
+MQTT_CONNECTED = Gauge("epever_mqtt_connected", "Verbindung zum Broker (1/0)")
+
+
+def new_client(client_id=""):
+    # paho-mqtt >= 2.0 verlangt die Angabe der Callback-API
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id)
+    return mqtt.Client(client_id)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class MqttPublisher:
+    def __init__(self, server, port=1883, user=None, password=None, client_id="",
+                 queue_size=1000, max_inflight=20, keepalive=60):
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_inflight = max_inflight
+        self.pending = {}
+        self.early_acks = {}
+        self.qos0_mids = set()
+        self.latencies = deque(maxlen=1000)
+        self.window = threading.Condition(threading.RLock())
+        self.connected = threading.Event()
+        self.running = False
+        self.worker = None
+        self.subscriptions = {}
+        self.counters = {"queued": 0, "dropped": 0, "sent": 0, "acked": 0, "connects": 0, "disconnects": 0}
+
+        self.client = new_client(client_id)
+        if user:
+            self.client.username_pw_set(user, password)
+        self.client.max_inflight_messages_set(max_inflight)
+        self.client.reconnect_delay_set(1, 60)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.on_message = self._on_message
+
+    def _count(self, event):
+        self.counters[event] += 1
+        MQTT_EVENTS.inc(event=event)
+
+    def _ack(self, latency):
+        self.latencies.append(latency)
+        MQTT_ACK_LATENCY.observe(latency)
+        self._count("acked")
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self._count("connects")
+            for topic, (callbacks, qos) in self.subscriptions.items():
+                client.subscribe(topic, qos)
+            self.connected.set()
+            MQTT_CONNECTED.set(1)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        MQTT_CONNECTED.set(0)
+        self._count("disconnects")
+        # Offene mids gelten nicht mehr, sonst blockieren sie das Fenster oder verfaelschen spaetere Latenzen
+        with self.window:
+            self.pending.clear()
+            self.early_acks.clear()
+            self.qos0_mids.clear()
+            self.window.notify_all()
+
+    def _on_publish(self, client, userdata, mid):
+        with self.window:
+            if mid in self.qos0_mids:
+                self.qos0_mids.discard(mid)
+                return
+            sent = self.pending.pop(mid, None)
+            if sent is not None:
+                self._ack(time.monotonic() - sent)
+            else:
+                # ACK kam schneller als die Rueckkehr aus publish()
+                self.early_acks[mid] = time.monotonic()
+            self.window.notify_all()
+
+    def _on_message(self, client, userdata, msg):
+        entry = self.subscriptions.get(msg.topic)
+        if entry:
+            for callback in entry[0]:
+                callback(msg.topic, msg.payload)
+
+    def subscribe(self, topic, callback, qos=0):
+        # Wird nach jedem Reconnect automatisch erneuert
+        if topic in self.subscriptions:
+            self.subscriptions[topic][0].append(callback)
+            return
+        self.subscriptions[topic] = ([callback], qos)
+        if self.connected.is_set():
+            self.client.subscribe(topic, qos)
+
+    def start(self):
+        self.running = True
+        self.client.connect_async(self.server, self.port, self.keepalive)
+        self.client.loop_start()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        return self
+
+    def set_max_inflight(self, max_inflight):
+        with self.window:
+            self.max_inflight = max_inflight
+            self.client.max_inflight_messages_set(max_inflight)
+            self.window.notify_all()
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        item = (topic, payload, qos, retain)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Aelteste Nachricht verwerfen, die neueste ist wichtiger
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self._count("dropped")
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(item)
+        self._count("queued")
+        MQTT_QUEUE_DEPTH.set(self.queue.qsize())
+        return True
+
+    def _run(self):
+        while self.running or not self.queue.empty():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                # Weckruf von stop()
+                self.queue.task_done()
+                continue
+            topic, payload, qos, retain = item
+            try:
+                while not self.connected.wait(1):
+                    if not self.running:
+                        break
+                with self.window:
+                    while qos > 0 and len(self.pending) >= self.max_inflight and self.connected.is_set():
+                        self.window.wait(1)
+                # publish() nicht unter dem eigenen Lock: paho ruft on_publish
+                # mit gehaltenem internen Lock auf
+                sent = time.monotonic()
+                info = self.client.publish(topic, payload, qos=qos, retain=retain)
+                with self.window:
+                    self._count("sent")
+                    # Auch bei QoS 0 meldet paho on_publish (nach dem Senden); ohne Zuordnung laege die mid
+                    # sonst in early_acks, bis eine spaetere QoS-1-Nachricht sie wiederverwendet
+                    acked = self.early_acks.pop(info.mid, None)
+                    if qos == 0 and acked is None and info.rc == mqtt.MQTT_ERR_SUCCESS:
+                        self.qos0_mids.add(info.mid)
+                    if qos > 0 and info.rc == mqtt.MQTT_ERR_SUCCESS:
+                        if acked is None:
+                            self.pending[info.mid] = sent
+                        else:
+                            self._ack(acked - sent)
+            finally:
+                self.queue.task_done()
+                MQTT_QUEUE_DEPTH.set(self.queue.qsize())
+
+    def flush(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.queue.unfinished_tasks == 0 and not self.pending:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def stop(self, timeout=10):
+        self.flush(timeout)
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.worker:
+            self.worker.join(timeout=2)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def stats(self):
+        latencies = list(self.latencies)
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        return {
+            **self.counters,
+            "connected": self.connected.is_set(),
+            "queue_depth": self.queue.qsize(),
+            "inflight": len(self.pending),
+            "ack_p50_ms": ms(percentile(latencies, 50)),
+            "ack_p95_ms": ms(percentile(latencies, 95)),
+            "ack_max_ms": ms(max(latencies) if latencies else None),
+        }
@@ -6,20 +6,25 @@ Kann als Standalone-Script oder als Service laufen:
     python mqtt_service.py              # Einmalig senden
     python mqtt_service.py --daemon     # Als Daemon (alle 60s)
     python mqtt_service.py --interval 30  # Alle 30 Sekunden
+    python mqtt_service.py --daemon --poller  # Daten vom Poller statt vom Geraet
 """
 
 import os
 import sys
 import json
-import time
 import signal
 import argparse
 from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-import paho.mqtt.client as mqtt
-from epever_controller import EpeverController, BATTERY_TYPES, LOAD_MODES
+from ha_discovery import DiscoveryPublisher, sensor_config
+from change_filter import ChangeFilter
+from energy_stats import EnergyAggregator, derived_definitions, ENERGY_FIELDS
+from payload_codec import PayloadEncoder, register_fields, PAYLOAD_ENCODING
+from poll_scheduler import PollScheduler, AdaptiveRate, poll_groups, poll_due, empty_snapshot
+from epever_core import EpeverController, BATTERY_TYPES, LOAD_MODES, REGISTER_MAP
+import metrics
 
 # Konfiguration aus Umgebungsvariablen oder Defaults
 EPEVER_HOST = os.environ.get('EPEVER_HOST', '192.168.178.150')
@@ -30,9 +35,34 @@ MQTT_SERVER = os.environ.get('MQTT_SERVER', '192.168.178.57')
 MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
 MQTT_USER = os.environ.get('MQTT_USER', 'tasmota')
 MQTT_PASS = os.environ.get('MQTT_PASS', 'Tasmota01$')
+MQTT_QOS = int(os.environ.get('MQTT_QOS', 1))
+MQTT_MAX_INFLIGHT = int(os.environ.get('MQTT_MAX_INFLIGHT', 20))
+MQTT_QUEUE_SIZE = int(os.environ.get('MQTT_QUEUE_SIZE', 1000))
+# Beim Start so lange auf den Broker warten, bevor der erste Zyklus gepuffert wird
+MQTT_CONNECT_WAIT = float(os.environ.get('MQTT_CONNECT_WAIT', 5))
+
+# 'device' = direkt vom WiFi-Modul lesen, 'poller' = Snapshot von epever_poller.py
+EPEVER_SOURCE = os.environ.get('EPEVER_SOURCE', 'device')
+SNAPSHOT_MAX_AGE = int(os.environ.get('SNAPSHOT_MAX_AGE', 120))
 
 DEVICE_ID = os.environ.get('DEVICE_ID', 'epever_xtra3210')
 DISCOVERY_PREFIX = os.environ.get('DISCOVERY_PREFIX', 'homeassistant')
+# 'full' = jeden Zyklus alle Felder, 'changes' = nur Felder ausserhalb ihres Totbands
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'full')
+# Jedes Feld zusaetzlich als Retained-Topic {DEVICE_ID}/<feld> statt im JSON-State
+PUBLISH_FIELD_TOPICS = os.environ.get('PUBLISH_FIELD_TOPICS', '0') == '1'
+# Heartbeat: Feld spaetestens nach so vielen Sekunden erneut senden
+MAX_SILENCE = int(os.environ.get('MAX_SILENCE', 300))
+# Abgeleitete Werte als HA-Sensoren: 'energy' = nur Wh-Zaehler, 'all' = auch gleitende min/max/Mittel, 'none'
+DERIVED_SENSORS = os.environ.get('DERIVED_SENSORS', 'energy')
+# Alarmregeln (alarm_engine.py) nach jeder Abfrage auswerten, Ereignisse an {DEVICE_ID}/event
+ALARMS = os.environ.get('ALARMS', '1') == '1'
+
+# 'entity' = ein Discovery-Topic pro Sensor, 'device' = ein Topic fuer das ganze Geraet, 'off' = keine Discovery
+DISCOVERY_MODE = os.environ.get('DISCOVERY_MODE', 'entity')
+
+# Prometheus-Metriken auf eigenem Port (0 = aus)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
 
 DEVICE_INFO = {
     "identifiers": [DEVICE_ID],
@@ -41,140 +71,299 @@ DEVICE_INFO = {
     "manufacturer": "EPEVER"
 }
 
+# (ID, Name, Einheit, Device-Class, State-Class, Totband)
 SENSOR_DEFINITIONS = [
-    ("pv_voltage", "PV Spannung", "V", "voltage", "measurement"),
-    ("pv_current", "PV Strom", "A", "current", "measurement"),
-    ("pv_power", "PV Leistung", "W", "power", "measurement"),
-    ("bat_voltage", "Batterie Spannung", "V", "voltage", "measurement"),
-    ("charge_current", "Ladestrom", "A", "current", "measurement"),
-    ("charge_power", "Ladeleistung", "W", "power", "measurement"),
-    ("load_voltage", "Last Spannung", "V", "voltage", "measurement"),
-    ("load_current", "Last Strom", "A", "current", "measurement"),
-    ("load_power", "Last Leistung", "W", "power", "measurement"),
-    ("bat_temp", "Batterie Temperatur", "°C", "temperature", "measurement"),
-    ("dev_temp", "Gerät Temperatur", "°C", "temperature", "measurement"),
-    ("bat_soc", "Batterie SOC", "%", "battery", "measurement"),
-    ("pv_max_today", "Max PV Spannung heute", "V", "voltage", "measurement"),
-    ("bat_min_today", "Min Bat Spannung heute", "V", "voltage", "measurement"),
-    ("bat_max_today", "Max Bat Spannung heute", "V", "voltage", "measurement"),
-    ("consumption_today", "Verbrauch heute", "kWh", "energy", "total_increasing"),
-    ("consumption_total", "Verbrauch gesamt", "kWh", "energy", "total_increasing"),
-    ("generation_today", "Erzeugung heute", "kWh", "energy", "total_increasing"),
-    ("generation_total", "Erzeugung gesamt", "kWh", "energy", "total_increasing"),
-    ("bat_capacity", "Batteriekapazität", "Ah", None, None),
-    ("bat_type", "Batterietyp", None, None, None),
-    ("last_update", "Letzte Aktualisierung", None, "timestamp", None),
+    ("pv_voltage", "PV Spannung", "V", "voltage", "measurement", 0.2),
+    ("pv_current", "PV Strom", "A", "current", "measurement", 0.05),
+    ("pv_power", "PV Leistung", "W", "power", "measurement", "2%"),
+    ("bat_voltage", "Batterie Spannung", "V", "voltage", "measurement", 0.02),
+    ("charge_current", "Ladestrom", "A", "current", "measurement", 0.05),
+    ("charge_power", "Ladeleistung", "W", "power", "measurement", "2%"),
+    ("load_voltage", "Last Spannung", "V", "voltage", "measurement", 0.02),
+    ("load_current", "Last Strom", "A", "current", "measurement", 0.02),
+    ("load_power", "Last Leistung", "W", "power", "measurement", "2%"),
+    ("bat_temp", "Batterie Temperatur", "°C", "temperature", "measurement", 0.5),
+    ("dev_temp", "Gerät Temperatur", "°C", "temperature", "measurement", 0.5),
+    ("bat_soc", "Batterie SOC", "%", "battery", "measurement", None),
+    ("pv_max_today", "Max PV Spannung heute", "V", "voltage", "measurement", None),
+    ("bat_min_today", "Min Bat Spannung heute", "V", "voltage", "measurement", None),
+    ("bat_max_today", "Max Bat Spannung heute", "V", "voltage", "measurement", None),
+    ("consumption_today", "Verbrauch heute", "kWh", "energy", "total_increasing", None),
+    ("consumption_total", "Verbrauch gesamt", "kWh", "energy", "total_increasing", None),
+    ("generation_today", "Erzeugung heute", "kWh", "energy", "total_increasing", None),
+    ("generation_total", "Erzeugung gesamt", "kWh", "energy", "total_increasing", None),
+    ("bat_capacity", "Batteriekapazität", "Ah", None, None, None),
+    ("bat_type", "Batterietyp", None, None, None, None),
+    ("last_update", "Letzte Aktualisierung", None, "timestamp", None, None),
+    ("poll_interval", "Abfrageintervall", "s", "duration", "measurement", None),
 ]
+# Wh-Zaehler und gleitende min/max/Mittelwerte (energy_stats.py); im State stehen immer alle,
+# als eigene HA-Sensoren nur die per DERIVED_SENSORS gewaehlten
+DERIVED_DEFINITIONS = derived_definitions(SENSOR_DEFINITIONS)
+ENERGY_COUNTERS = {counter for _, counter, _ in ENERGY_FIELDS}
+SENSOR_DEFINITIONS += [d for d in DERIVED_DEFINITIONS
+                       if DERIVED_SENSORS == "all" or (DERIVED_SENSORS == "energy" and d[0] in ENERGY_COUNTERS)]
+DIAGNOSTIC_SENSORS = {"poll_interval"}
 
 running = True
+publisher = None
+discovery = None
+outage_buffer = None
+replayer = None
+change_filter = ChangeFilter({d[0]: d[5] for d in SENSOR_DEFINITIONS + DERIVED_DEFINITIONS}, MAX_SILENCE)
+# State-Payload json/msgpack/cbor/packed (payload_codec.py), Feldreihenfolge fuer packed
+STATE_FIELDS = register_fields(REGISTER_MAP, [d[0] for d in SENSOR_DEFINITIONS + DERIVED_DEFINITIONS] + ["last_sync"])
+encoder = PayloadEncoder(PAYLOAD_ENCODING, STATE_FIELDS)
 
 def signal_handler(sig, frame):
     global running
     running = False
     print("\nBeende Service...")
 
-def publish_discovery(mq):
-    for sid, name, unit, d_class, s_class in SENSOR_DEFINITIONS:
-        config = {
-            "name": name,
-            "state_topic": f"{DEVICE_ID}/state",
-            "value_template": f"{{{{ value_json.{sid} }}}}",
-            "unique_id": f"{DEVICE_ID}_{sid}",
-            "device": DEVICE_INFO
-        }
-        if unit:
-            config["unit_of_measurement"] = unit
-        if d_class:
-            config["device_class"] = d_class
-        if s_class:
-            config["state_class"] = s_class
-        
-        topic = f"{DISCOVERY_PREFIX}/sensor/{DEVICE_ID}/{sid}/config"
-        mq.publish(topic, json.dumps(config), retain=True)
+def check_payload_encoding(encoding=PAYLOAD_ENCODING, discovery_mode=DISCOVERY_MODE, field_topics=PUBLISH_FIELD_TOPICS):
+    # Discovery liest value_json aus {DEVICE_ID}/state, das kann Home Assistant nur bei JSON
+    if encoding != "json" and discovery_mode != "off" and not field_topics:
+        raise RuntimeError(f"PAYLOAD_ENCODING={encoding} ist fuer Home Assistant nicht lesbar, "
+                           f"DISCOVERY_MODE=off oder PAYLOAD_ENCODING=json setzen")
+
+def discovery_components(device_id=DEVICE_ID, fields=None, field_topics=PUBLISH_FIELD_TOPICS, mode=PUBLISH_MODE):
+    # fields: nur diese Sensoren (z.B. Fleet-Gateway ohne abgeleitete Werte), field_topics/mode wie der Sender
+    components = []
+    for sid, name, unit, d_class, s_class, _ in SENSOR_DEFINITIONS:
+        if fields is not None and sid not in fields:
+            continue
+        config = sensor_config(device_id, sid, name, unit, d_class, s_class,
+                               "diagnostic" if sid in DIAGNOSTIC_SENSORS else None)
+        if field_topics:
+            config["state_topic"] = f"{device_id}/{sid}"
+            config["value_template"] = "{{ value }}"
+        elif mode == "changes":
+            # Teil-Payloads: fehlende Felder behalten ihren bisherigen Zustand
+            config["value_template"] = f"{{{{ value_json.{sid} if value_json.{sid} is defined else this.state }}}}"
+        components.append((sid, config))
+    return components
+
+def get_publisher():
+    global publisher, discovery, outage_buffer, replayer
+    if publisher is None:
+        # Transport erst beim ersten Senden laden (paho-mqtt, SQLite-Puffer)
+        from mqtt_publisher import MqttPublisher
+        from mqtt_buffer import OutageBuffer, Replayer, MQTT_BUFFER_DB
+        publisher = MqttPublisher(MQTT_SERVER, MQTT_PORT, MQTT_USER, MQTT_PASS,
+                                  queue_size=MQTT_QUEUE_SIZE, max_inflight=MQTT_MAX_INFLIGHT).start()
+        if DISCOVERY_MODE != "off":
+            discovery = DiscoveryPublisher(publisher, DEVICE_ID, DEVICE_INFO, discovery_components(),
+                                           DISCOVERY_PREFIX, DISCOVERY_MODE)
+            discovery.attach()
+        if MQTT_BUFFER_DB:
+            outage_buffer = OutageBuffer(MQTT_BUFFER_DB)
+            replayer = Replayer(outage_buffer, publisher, MQTT_QOS).start()
+        publisher.connected.wait(MQTT_CONNECT_WAIT)
+    return publisher
+
+def stop_publisher():
+    global publisher, discovery, outage_buffer, replayer
+    if replayer is not None:
+        replayer.stop()
+        replayer = None
+    if publisher is not None:
+        publisher.stop()
+        publisher = None
+        discovery = None
+    if outage_buffer is not None:
+        outage_buffer.close()
+        outage_buffer = None
+
+def alarm_messages(events, engine):
+    # Ereignisse einzeln (nicht retained), dazu die Liste der aktiven Alarme retained
+    messages = [(f"{DEVICE_ID}/event", json.dumps(event), False) for event in events]
+    if events:
+        messages.append((f"{DEVICE_ID}/alarms", json.dumps(engine.active()), True))
+        for event in events:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Alarm {event['rule']} {event['event']}: "
+                  f"{event['message']}", flush=True)
+    return messages
 
-def send_to_mqtt(data):
+def send_to_mqtt(data, alarms=()):
     try:
-        mq = mqtt.Client()
-        if MQTT_USER:
-            mq.username_pw_set(MQTT_USER, MQTT_PASS)
-        mq.connect(MQTT_SERVER, MQTT_PORT, 60)
-        
-        publish_discovery(mq)
+        mq = get_publisher()
         
         payload = {
             **data["realtime"],
             **data["statistics"],
             **data["settings"],
+            **data.get("derived", {}),
             "last_sync": data["last_update"],
             "last_update": datetime.now().isoformat()
         }
         
-        mq.publish(f"{DEVICE_ID}/state", json.dumps(payload))
-        mq.disconnect()
-        
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Daten an HA gesendet - SOC: {data['realtime'].get('bat_soc', 'N/A')}%", flush=True)
+        full = encoder.encode(payload)
+        fields = change_filter.update(payload) if PUBLISH_MODE == "changes" else payload
+        messages = []
+        if PUBLISH_FIELD_TOPICS:
+            messages = [(f"{DEVICE_ID}/{key}", str(value), True) for key, value in fields.items()]
+        elif fields:
+            messages = [(f"{DEVICE_ID}/state", full if fields is payload else encoder.encode(fields), False)]
+            schema = encoder.schema_message()
+            if schema:
+                # Vor dem State, damit Konsumenten die neue Version kennen
+                messages.insert(0, (f"{DEVICE_ID}/schema", schema, True))
+        sent = sum(len(topic) + len(body) for topic, body, _ in messages)
+        change_filter.account(len(DEVICE_ID) + 6 + len(full), sent)
+        # Alarm-Ereignisse vor dem State, sie sollen ohne Verzoegerung beim Konsumenten sein
+        messages[:0] = alarms
+
+        if outage_buffer is not None and (outage_buffer.depth() or not mq.connected.is_set()):
+            # Broker weg oder Nachsenden laeuft noch: Reihenfolge bleibt erhalten
+            if messages:
+                outage_buffer.append(messages)
+            reason = "Nachsenden laeuft" if mq.connected.is_set() else "MQTT nicht verbunden"
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {reason}, Zyklus gepuffert "
+                  f"({outage_buffer.depth()} im Puffer)", flush=True)
+            return True
+        for topic, body, retain in messages:
+            mq.publish(topic, body, qos=MQTT_QOS, retain=retain)
+
+        stats = mq.stats()
+        saved = change_filter.stats()
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Daten an HA gesendet - SOC: {data['realtime'].get('bat_soc', 'N/A')}% "
+              f"({len(fields)} Felder, gespart: {saved['saved_pct']}%, Queue: {stats['queue_depth']}, "
+              f"ACK p50: {stats['ack_p50_ms']} ms)", flush=True)
         return True
         
     except Exception as e:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] MQTT Fehler: {e}", flush=True)
         return False
 
-def run_once():
+def fetch_data(ctrl, source=EPEVER_SOURCE, keep_open=False):
+    if source == "poller":
+        from epever_poller import get_snapshot
+        return get_snapshot(max_age=SNAPSHOT_MAX_AGE)
+    if not (ctrl.ensure_connected() if keep_open else ctrl.connect()):
+        return None
+    try:
+        return ctrl.get_all_data()
+    finally:
+        if not keep_open:
+            ctrl.disconnect()
+
+def run_once(source=EPEVER_SOURCE):
     ctrl = EpeverController(EPEVER_HOST, EPEVER_PORT, SLAVE_ID)
-    if not ctrl.connect():
+    data = fetch_data(ctrl, source)
+    if data is None:
         print("FEHLER: Keine Verbindung zum EPEVER")
         return False
-    
     try:
-        data = ctrl.get_all_data()
         return send_to_mqtt(data)
     finally:
-        ctrl.disconnect()
+        stop_publisher()
 
-def run_daemon(interval=60):
+def run_daemon(interval=60, source=EPEVER_SOURCE, stats_interval=60, settings_interval=3600, adaptive=None):
     global running
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
     ctrl = EpeverController(EPEVER_HOST, EPEVER_PORT, SLAVE_ID)
+    scheduler = PollScheduler(poll_groups(interval, max(interval, stats_interval), max(interval, settings_interval)))
+    rate = AdaptiveRate(scheduler, *adaptive) if adaptive and source != "poller" else None
+    aggregator = EnergyAggregator()
+    data = empty_snapshot()
+    alarms = None
+    if ALARMS:
+        from alarm_engine import AlarmEngine, snapshot_values
+        alarms = AlarmEngine()
     
-    print(f"EPEVER MQTT Service gestartet (Interval: {interval}s)")
+    print(f"EPEVER MQTT Service gestartet (Echtzeit: {interval}s, Statistik: {stats_interval}s, Einstellungen: {settings_interval}s)")
+    if rate:
+        print(f"Adaptiv: {rate.min_period}-{rate.max_period}s")
     print(f"MQTT: {MQTT_SERVER}:{MQTT_PORT}")
-    print(f"EPEVER: {EPEVER_HOST}:{EPEVER_PORT}")
+    print(f"EPEVER: {EPEVER_HOST}:{EPEVER_PORT}" if source != "poller" else "EPEVER: via Poller")
     print()
     
+    reconnects = 0
+    skipped = scheduler.skipped()
     while running:
-        if ctrl.connect():
-            try:
-                data = ctrl.get_all_data()
-                send_to_mqtt(data)
-            except Exception as e:
-                print(f"Fehler: {e}")
-            finally:
-                ctrl.disconnect()
-        else:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Keine Verbindung zum EPEVER")
+        try:
+            if source == "poller":
+                due = scheduler.due()
+                started = scheduler.clock()
+                snapshot = fetch_data(ctrl, source)
+                for group in due:
+                    scheduler.mark_run(group, started, scheduler.clock())
+                if snapshot is not None:
+                    events = alarms.evaluate(snapshot_values(snapshot)) if alarms else []
+                    send_to_mqtt(snapshot, alarm_messages(events, alarms))
+                else:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Keine Daten vom Poller")
+            elif ctrl.ensure_connected():
+                if poll_due(ctrl, scheduler, data, rate, aggregator) and data["realtime"]:
+                    events = alarms.evaluate(snapshot_values(data)) if alarms else []
+                    send_to_mqtt(data, alarm_messages(events, alarms))
+            else:
+                if ctrl.breaker_open():
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] EPEVER nicht erreichbar, naechster Versuch spaeter ({ctrl.failures} Fehler)")
+                else:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Keine Verbindung zum EPEVER")
+        except Exception as e:
+            print(f"Fehler: {e}")
+        for group in scheduler.due():
+            scheduler.skip(group)
+        if ctrl.reconnect_count != reconnects:
+            reconnects = ctrl.reconnect_count
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Verbindung wiederhergestellt (Verbindungen: {ctrl.connect_count}, Reconnects: {reconnects})", flush=True)
+        now_skipped = scheduler.skipped()
+        if now_skipped != skipped:
+            late = ", ".join(f"{g} +{n - skipped[g]}" for g, n in now_skipped.items() if n != skipped[g])
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Termine uebersprungen: {late}", flush=True)
+            skipped = now_skipped
         
-        for _ in range(interval):
-            if not running:
-                break
-            time.sleep(1)
+        scheduler.wait(lambda: running)
     
-    print("Service beendet")
+    ctrl.disconnect()
+    if publisher is not None:
+        mq_stats = publisher.stats()
+        print(f"MQTT: {mq_stats['acked']}/{mq_stats['sent']} bestaetigt, {mq_stats['dropped']} verworfen, "
+              f"ACK p95: {mq_stats['ack_p95_ms']} ms")
+    stop_publisher()
+    saved = change_filter.stats()
+    print(f"Bytes: {saved['bytes_sent']} gesendet, {saved['bytes_saved']} gespart ({saved['saved_pct']}%)")
+    for group, st in scheduler.stats().items():
+        print(f"{group}: {st['runs']} Abfragen, {st['skipped']} uebersprungen, {st['overruns']} Ueberlaeufe, "
+              f"Jitter p95: {st['jitter_p95_ms']} ms")
+    stats = ctrl.connection_stats()
+    print(f"Service beendet (Verbindungen: {stats['connects']}, Reconnects: {stats['reconnects']})")
 
 def main():
     parser = argparse.ArgumentParser(description="EPEVER MQTT Service")
     parser.add_argument("--daemon", "-d", action="store_true", help="Als Daemon laufen")
-    parser.add_argument("--interval", "-i", type=int, default=60, help="Interval in Sekunden (default: 60)")
+    parser.add_argument("--interval", "-i", type=float, default=60, help="Interval Echtzeitdaten in Sekunden (default: 60)")
+    parser.add_argument("--stats-interval", type=float, default=60, help="Interval Statistiken in Sekunden (default: 60)")
+    parser.add_argument("--settings-interval", type=float, default=3600, help="Interval Einstellungen in Sekunden (default: 3600)")
     parser.add_argument("--once", "-o", action="store_true", help="Einmalig senden und beenden")
+    parser.add_argument("--poller", action="store_true", help="Daten vom Poller lesen (epever_poller.py)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Echtzeit-Intervall an PV- und Lastaenderungen anpassen (nur direkt vom Geraet)")
+    parser.add_argument("--min-interval", type=float, default=5, help="Kuerzestes adaptives Interval (default: 5)")
+    parser.add_argument("--max-interval", type=float, default=300, help="Laengstes adaptives Interval (default: 300)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Prometheus /metrics auf diesem Port")
     args = parser.parse_args()
+    source = "poller" if args.poller else EPEVER_SOURCE
+    try:
+        check_payload_encoding()
+    except RuntimeError as e:
+        print(f"FEHLER: {e}")
+        sys.exit(1)
     
     if args.daemon:
-        run_daemon(args.interval)
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+            print(f"Metriken: http://0.0.0.0:{args.metrics_port}/metrics")
+        run_daemon(args.interval, source, args.stats_interval, args.settings_interval,
+                   (args.min_interval, args.max_interval) if args.adaptive else None)
     elif args.once:
-        run_once()
+        run_once(source)
     else:
-        run_once()
+        run_once(source)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Kodierung des State-Payloads ({DEVICE_ID}/state)
+
+PAYLOAD_ENCODING waehlt das Format:
+    json     - JSON-Objekt wie bisher (Home Assistant Discovery erwartet JSON)
+    msgpack  - MessagePack-Map mit denselben Schluesseln (pip install msgpack)
+    cbor     - CBOR-Map mit denselben Schluesseln (pip install cbor2)
+    packed   - kompaktes JSON-Array [Version, Wert, Wert, ...] in der Reihenfolge
+               der Registertabelle, fehlende Felder als null
+
+Bei allen Formaten ausser json steht unter {DEVICE_ID}/schema (retained) das
+Format, die Schema-Version und die Feldliste. Taucht ein neues Feld auf, wird
+es hinten angehaengt und das Schema mit neuer Version erneut gesendet; aeltere
+Versionen bleiben fuer gepufferte Nachrichten dekodierbar.
+
+Decoder fuer Konsumenten:
+
+    decoder = PayloadDecoder()
+    decoder.load_schema(schema_payload)     # Nachricht von {DEVICE_ID}/schema
+    decoder.decode(state_payload)           # -> dict
+
+    python payload_codec.py --device epever_xtra3210   # States dekodiert ausgeben
+"""
+
+import os
+import json
+import zlib
+import argparse
+
+PAYLOAD_ENCODING = os.environ.get('PAYLOAD_ENCODING', 'json')
+ENCODINGS = ("json", "msgpack", "cbor", "packed")
+
+# Optionale Pakete fuer die Binaerformate: (Modul, Paketname)
+BINARY_MODULES = {"msgpack": ("msgpack", "msgpack"), "cbor": ("cbor2", "cbor2")}
+
+
+def binary_codec(encoding):
+    # (dumps, loads) des Binaerformats, das Paket wird erst bei Bedarf importiert
+    module, package = BINARY_MODULES[encoding]
+    try:
+        codec = __import__(module)
+    except ImportError:
+        raise RuntimeError(f"PAYLOAD_ENCODING={encoding} braucht das Paket {package} (pip install {package})")
+    if encoding == "msgpack":
+        return codec.packb, codec.unpackb
+    return codec.dumps, codec.loads
+
+
+def register_fields(entries, extra=()):
+    """Feldreihenfolge des packed-Formats: Registertabelle (Listenwerte mit _raw), danach extra"""
+    fields = []
+    for addr, sid, kind, dtype, factor, group, options in entries:
+        fields.append(sid)
+        if options:
+            fields.append(f"{sid}_raw")
+    for sid in extra:
+        if sid not in fields:
+            fields.append(sid)
+    return fields
+
+
+def schema_version(fields):
+    return f"{zlib.crc32(','.join(fields).encode()):08x}"
+
+
+class PayloadEncoder:
+    def __init__(self, encoding=PAYLOAD_ENCODING, fields=()):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unbekanntes PAYLOAD_ENCODING {encoding} ({', '.join(ENCODINGS)})")
+        self.encoding = encoding
+        self.fields = list(fields)
+        self.index = {sid: i for i, sid in enumerate(self.fields)}
+        self.version = schema_version(self.fields)
+        self.published = None
+        self.dumps = binary_codec(encoding)[0] if encoding in BINARY_MODULES else None
+
+    def encode(self, payload):
+        if self.encoding == "json":
+            return json.dumps(payload)
+        if self.dumps:
+            return self.dumps(payload)
+        for sid in payload:
+            if sid not in self.index:
+                self.index[sid] = len(self.fields)
+                self.fields.append(sid)
+                self.version = schema_version(self.fields)
+        values = [None] * len(self.fields)
+        for sid, value in payload.items():
+            values[self.index[sid]] = value
+        while values and values[-1] is None:
+            values.pop()
+        return json.dumps([self.version, *values], separators=(",", ":"))
+
+    def schema(self):
+        return {"encoding": self.encoding, "version": self.version, "fields": self.fields}
+
+    def schema_message(self):
+        """Schema als JSON, nur wenn es noch nicht (in dieser Version) gesendet wurde"""
+        if self.encoding == "json" or self.published == self.version:
+            return None
+        self.published = self.version
+        return json.dumps(self.schema())
+
+
+class PayloadDecoder:
+    def __init__(self, encoding="json"):
+        self.encoding = encoding
+        self.schemas = {}
+
+    def load_schema(self, body):
+        schema = json.loads(body)
+        self.encoding = schema["encoding"]
+        self.schemas[schema["version"]] = schema["fields"]
+        return schema
+
+    def decode(self, body):
+        if self.encoding == "json":
+            return json.loads(body)
+        if self.encoding in BINARY_MODULES:
+            return binary_codec(self.encoding)[1](body)
+        version, *values = json.loads(body)
+        if version not in self.schemas:
+            raise ValueError(f"Unbekannte Schema-Version {version}, Schema-Topic noch nicht empfangen")
+        return {sid: value for sid, value in zip(self.schemas[version], values) if value is not None}
+
+
+def main():
+    from mqtt_publisher import new_client
+
+    parser = argparse.ArgumentParser(description="EPEVER State-Payload dekodieren")
+    parser.add_argument("--device", default=os.environ.get('DEVICE_ID', 'epever_xtra3210'), help="DEVICE_ID")
+    parser.add_argument("--server", default=os.environ.get('MQTT_SERVER', '192.168.178.57'), help="MQTT-Broker")
+    parser.add_argument("--port", type=int, default=int(os.environ.get('MQTT_PORT', 1883)), help="MQTT-Port")
+    parser.add_argument("--user", default=os.environ.get('MQTT_USER', ''), help="MQTT-Benutzer")
+    parser.add_argument("--password", default=os.environ.get('MQTT_PASS', ''), help="MQTT-Passwort")
+    args = parser.parse_args()
+
+    decoder = PayloadDecoder()
+
+    def on_message(client, userdata, msg):
+        try:
+            if msg.topic.endswith("/schema"):
+                schema = decoder.load_schema(msg.payload)
+                print(f"Schema {schema['version']} ({schema['encoding']}, {len(schema['fields'])} Felder)")
+            else:
+                print(json.dumps(decoder.decode(msg.payload)), flush=True)
+        except (ValueError, RuntimeError) as e:
+            print(f"FEHLER: {e}")
+
+    client = new_client()
+    if args.user:
+        client.username_pw_set(args.user, args.password)
+    client.on_message = on_message
+    client.connect(args.server, args.port)
+    # Schema zuerst abonnieren, der Broker liefert die Retained-Nachricht sofort
+    client.subscribe([(f"{args.device}/schema", 1), (f"{args.device}/state", 0)])
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Deadline-basierter Abfrage-Scheduler mit eigener Periode pro Registergruppe
+
+Jede Gruppe (realtime, statistics, settings) hat eine feste Periode und
+Prioritaet. Die Termine liegen auf einem festen Raster (start + n * Periode),
+die Laufzeit eines Zyklus verschiebt den naechsten Termin also nicht.
+Verpasste Termine werden uebersprungen statt nachgeholt.
+"""
+
+import os
+import time
+from datetime import datetime
+from collections import deque
+
+from change_filter import parse_deadband
+from metrics import Gauge, Histogram
+
+POLL_DURATION = Histogram("epever_poll_group_seconds", "Dauer einer Abfrage pro Registergruppe", ["group"])
+CYCLE_DURATION = Histogram("epever_poll_cycle_seconds", "Dauer eines Abfragezyklus (alle faelligen Gruppen)")
+POLL_INTERVAL = Gauge("epever_poll_interval_seconds", "Aktuelle Periode pro Registergruppe", ["group"])
+
+# Standard-Perioden in Sekunden: (Gruppe, Periode, Prioritaet)
+POLL_GROUPS = [
+    ("realtime", 5, 0),
+    ("statistics", 60, 1),
+    ("settings", 3600, 2),
+]
+
+
+# Aenderung zwischen zwei Abfragen, ab der auf die schnelle Rate gewechselt wird
+# (absolut oder relativ wie bei den Totbaendern, z.B. "pv_power=20,charge_current=0.5,load_power=10%")
+ADAPTIVE_THRESHOLDS = os.environ.get('ADAPTIVE_THRESHOLDS', 'pv_power=20,charge_current=0.5,load_power=10')
+
+
+def parse_thresholds(spec):
+    thresholds = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        field, _, value = item.partition("=")
+        thresholds[field.strip()] = value.strip() if value.strip().endswith("%") else float(value)
+    return thresholds
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def poll_groups(realtime=5, statistics=60, settings=3600):
+    return [("realtime", realtime, 0), ("statistics", statistics, 1), ("settings", settings, 2)]
+
+
+# Gruppen im Snapshot, "derived" = abgeleitete Werte (energy_stats.py)
+SNAPSHOT_GROUPS = ("realtime", "statistics", "settings", "derived")
+
+
+def empty_snapshot():
+    return {"realtime": {}, "statistics": {}, "settings": {}, "derived": {}, "last_update": None}
+
+
+class PollScheduler:
+    def __init__(self, groups=POLL_GROUPS, clock=time.monotonic):
+        self.clock = clock
+        start = clock()
+        self.tasks = {
+            name: {"period": period, "priority": priority, "next": start,
+                   "runs": 0, "skipped": 0, "overruns": 0, "lateness": deque(maxlen=500)}
+            for name, period, priority in groups
+        }
+
+    def due(self, now=None):
+        now = self.clock() if now is None else now
+        names = [name for name, task in self.tasks.items() if task["next"] <= now]
+        return sorted(names, key=lambda name: self.tasks[name]["priority"])
+
+    def mark_run(self, name, started, finished):
+        task = self.tasks[name]
+        scheduled = task["next"]
+        task["runs"] += 1
+        task["lateness"].append(max(0.0, started - scheduled))
+        if finished - started > task["period"]:
+            task["overruns"] += 1
+        nxt = scheduled + task["period"]
+        while nxt <= finished:
+            nxt += task["period"]
+            task["skipped"] += 1
+        task["next"] = nxt
+
+    def skip(self, name):
+        # Termin ohne Abfrage verwerfen (z.B. Geraet nicht erreichbar)
+        task = self.tasks[name]
+        now = self.clock()
+        while task["next"] <= now:
+            task["next"] += task["period"]
+            task["skipped"] += 1
+
+    def skipped(self):
+        return {name: task["skipped"] for name, task in self.tasks.items()}
+
+    def reschedule(self, name, delay=None):
+        task = self.tasks[name]
+        task["next"] = self.clock() + (task["period"] if delay is None else delay)
+
+    def set_period(self, name, period):
+        task = self.tasks[name]
+        task["next"] = min(task["next"], self.clock() + period)
+        task["period"] = period
+
+    def next_deadline(self):
+        return min(task["next"] for task in self.tasks.values())
+
+    def wait(self, keep_running=lambda: True, step=0.5):
+        while keep_running():
+            remaining = self.next_deadline() - self.clock()
+            if remaining <= 0:
+                return True
+            time.sleep(min(step, remaining))
+        return False
+
+    def stats(self):
+        result = {}
+        for name, task in self.tasks.items():
+            lateness = list(task["lateness"])
+            result[name] = {
+                "period": task["period"],
+                "runs": task["runs"],
+                "skipped": task["skipped"],
+                "overruns": task["overruns"],
+                "jitter_p50_ms": round(percentile(lateness, 50) * 1000, 1) if lateness else None,
+                "jitter_p95_ms": round(percentile(lateness, 95) * 1000, 1) if lateness else None,
+            }
+        return result
+
+
+class AdaptiveRate:
+    """Periode der Echtzeitgruppe abhaengig von der Aktivitaet.
+
+    Aendert sich ein Feld zwischen zwei Abfragen um mehr als seine Schwelle,
+    springt die Periode sofort auf min_period. Erst nach calm_cycles ruhigen
+    Abfragen in Folge (alle Aenderungen unter calm_ratio * Schwelle) wird sie
+    schrittweise um backoff bis max_period verlaengert. Dazwischen bleibt sie.
+    """
+
+    def __init__(self, scheduler, min_period=2, max_period=60, thresholds=None, group="realtime",
+                 calm_cycles=5, calm_ratio=0.5, backoff=2.0):
+        self.scheduler = scheduler
+        self.group = group
+        self.min_period = min_period
+        self.max_period = max_period
+        self.thresholds = {k: parse_deadband(v) for k, v in
+                           (parse_thresholds(ADAPTIVE_THRESHOLDS) if thresholds is None else thresholds).items()}
+        self.calm_cycles = calm_cycles
+        self.calm_ratio = calm_ratio
+        self.backoff = backoff
+        self.last = None
+        self.calm = 0
+        self.changes = 0
+        self.set_period(min(max(scheduler.tasks[group]["period"], min_period), max_period))
+
+    def set_period(self, period):
+        if period != self.scheduler.tasks[self.group]["period"]:
+            self.changes += 1
+        self.scheduler.set_period(self.group, period)
+
+    def activity(self, values):
+        # Groesste Aenderung relativ zur jeweiligen Schwelle (1.0 = Schwelle erreicht)
+        level = 0.0
+        for field, (absolute, relative) in self.thresholds.items():
+            old, new = self.last.get(field), values.get(field)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+                continue
+            limit = max(absolute, relative * abs(old))
+            if limit > 0:
+                level = max(level, abs(new - old) / limit)
+        return level
+
+    def update(self, values):
+        period = self.scheduler.tasks[self.group]["period"]
+        if self.last is not None:
+            level = self.activity(values)
+            if level > 1:
+                self.calm = 0
+                period = self.min_period
+            elif level < self.calm_ratio:
+                self.calm += 1
+                if self.calm >= self.calm_cycles:
+                    self.calm = 0
+                    period = min(self.max_period, period * self.backoff)
+            else:
+                self.calm = 0
+        self.last = values
+        self.set_period(period)
+        return period
+
+
+def poll_due(ctrl, scheduler, snapshot, adaptive=None, aggregator=None):
+    # Liest alle faelligen Gruppen in Prioritaetsreihenfolge in den Snapshot ein
+    ran = []
+    sampled = None
+    cycle_started = scheduler.clock()
+    for group in scheduler.due():
+        started = scheduler.clock()
+        values = ctrl.read_plan(ctrl.plans[group])
+        finished = scheduler.clock()
+        scheduler.mark_run(group, started, finished)
+        POLL_DURATION.observe(finished - started, group=group)
+        if values:
+            snapshot[group] = values
+            ran.append(group)
+            if group == "realtime":
+                sampled = (started + finished) / 2
+    if ran:
+        CYCLE_DURATION.observe(scheduler.clock() - cycle_started)
+    if "realtime" in ran:
+        if aggregator is not None:
+            snapshot["derived"] = aggregator.update(snapshot["realtime"], sampled)
+        if adaptive is not None:
+            adaptive.update(snapshot["realtime"])
+        # Aktuelle Periode als Diagnosewert mitliefern
+        snapshot["realtime"]["poll_interval"] = scheduler.tasks["realtime"]["period"]
+        snapshot["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for group in ran:
+        POLL_INTERVAL.set(scheduler.tasks[group]["period"], group=group)
+    return ran
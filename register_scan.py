@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Registerscan ueber ganze Adressbereiche (neue Firmware, Tracer-AN, ...)
+
+Liest Input-, Holding-Register, Coils und Discrete Inputs blockweise. Ein
+Block mit Fehler wird halbiert, bis jede ungueltige Adresse einzeln feststeht.
+Der Stand wird laufend in die Ausgabedatei geschrieben: nach einem
+Verbindungsabbruch wird neu verbunden und der Block wiederholt, ein
+abgebrochener Lauf setzt beim naechsten Start mit derselben Datei fort.
+
+Erlaubt das WiFi-Modul mehrere Verbindungen, verteilen --connections Worker
+die Bloecke; abgelehnte Zusatzverbindungen beenden nur ihren Worker.
+
+    python epever_controller.py --scan
+    python epever_controller.py --scan --scan-ranges input:0x3000-0x33FF --connections 4
+
+Ergebnis (JSON): gueltige Bereiche und Rohwerte pro Registertyp sowie der
+Abgleich mit REALTIME_INPUTS, STATISTICS_INPUTS, DEVICE_INFO_INPUTS und
+SETTINGS_HOLDINGS (unbekannte gueltige Adressen, fehlende bekannte Register).
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+
+from epever_core import (REALTIME_INPUTS, STATISTICS_INPUTS, DEVICE_INFO_INPUTS, SETTINGS_HOLDINGS,
+                         REGISTER_MAP, REGISTER_WIDTH, EpeverController, backoff_delay, device_limits,
+                         MODBUS_TIMEOUT)
+from device_probe import read_raw, to_ranges
+
+REGISTER_SCAN_FILE = os.environ.get('REGISTER_SCAN_FILE', 'register_map.json')
+
+# (Registertyp, erste, letzte Adresse)
+SCAN_RANGES = [
+    ("input", 0x3000, 0x33FF),
+    ("holding", 0x9000, 0x90FF),
+    ("coil", 0x0000, 0x00FF),
+    ("discrete", 0x2000, 0x20FF),
+]
+
+SAVE_INTERVAL = 2
+MAX_RETRIES = 4
+
+
+class ConnectionLost(Exception):
+    pass
+
+
+def parse_ranges(spec):
+    # "input:0x3000-0x33FF,holding:0x9000-0x90FF"
+    ranges = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, span = item.partition(":")
+        first, _, last = span.partition("-")
+        if kind not in ("input", "holding", "coil", "discrete"):
+            raise ValueError(f"Unbekannter Registertyp: {kind}")
+        ranges.append((kind, int(first, 0), int(last or first, 0)))
+    return ranges
+
+
+def scan_block(ctrl, kind, start, count, retries=MAX_RETRIES, untested=False):
+    """Rohwerte und ungueltige Adressen eines Blocks, Fehlerbloecke werden halbiert
+
+    untested: Zusatzverbindung ohne bisherige Antwort, vom Modul abgelehnte
+    Verbindungen werden nach einem Reconnect aufgegeben.
+    """
+    values, invalid = {}, []
+    pending = [(start, count)]
+    lost = 0
+    while pending:
+        addr, n = pending.pop()
+        connects = ctrl.connect_count
+        status, regs, _ = read_raw(ctrl, kind, addr, n)
+        if status == "ok":
+            values.update(zip(range(addr, addr + n), regs))
+            lost = 0
+        elif status == "timeout" and (ctrl.connect_count != connects or not ctrl.is_connected()):
+            # Verbindung war weg: Abfrage nach dem Reconnect wiederholen statt Adressen als ungueltig zu werten
+            lost += 1
+            if lost > (1 if untested and not (values or invalid) else retries):
+                raise ConnectionLost
+            pending.append((addr, n))
+            time.sleep(backoff_delay(lost))
+            if not ctrl.is_connected():
+                ctrl.connect()
+        elif n > 1:
+            half = n // 2
+            pending += [(addr + half, n - half), (addr, half)]
+        else:
+            invalid.append(addr)
+    return values, invalid
+
+
+def known_registers():
+    # {Registertyp: {Adresse: Name}} der eingebauten Tabellen, 32-Bit-Werte mit beiden Adressen
+    widths = {(e[2], e[0]): REGISTER_WIDTH[e[3]] for e in REGISTER_MAP}
+    known = {"input": {}, "holding": {}}
+    tables = [("input", t) for t in (REALTIME_INPUTS, STATISTICS_INPUTS, DEVICE_INFO_INPUTS)]
+    tables.append(("holding", SETTINGS_HOLDINGS))
+    for kind, table in tables:
+        for entry in table:
+            addr, sid = entry[0], entry[1]
+            wide = entry[-1] is True
+            for i in range(max(widths.get((kind, addr), 1), 2 if wide else 1)):
+                known[kind][addr + i] = sid if i == 0 else f"{sid} (high)"
+    return known
+
+
+def diff_map(values, ranges):
+    """Abgleich Scan <-> eingebaute Tabellen (nur innerhalb der gescannten Bereiche)"""
+    known = known_registers()
+    scanned = lambda kind, addr: any(k == kind and lo <= addr <= hi for k, lo, hi in ranges)
+    diff = {"unknown": {}, "missing": {}, "matched": 0}
+    for kind, found in values.items():
+        table = known.get(kind, {})
+        unknown = [f"0x{a:04X}" for a in sorted(found) if a not in table]
+        if unknown:
+            diff["unknown"][kind] = unknown
+        diff["matched"] += sum(1 for a in found if a in table)
+    for kind, table in known.items():
+        missing = {f"0x{a:04X}": sid for a, sid in sorted(table.items())
+                   if scanned(kind, a) and a not in values.get(kind, {})}
+        if missing:
+            diff["missing"][kind] = missing
+    return diff
+
+
+class RegisterScan:
+    def __init__(self, host, port, slave_id=1, ranges=SCAN_RANGES, path=REGISTER_SCAN_FILE, connections=1,
+                 max_block=None, timeout=MODBUS_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.slave_id = slave_id
+        self.ranges = [tuple(r) for r in ranges]
+        self.path = path
+        self.connections = max(1, connections)
+        self.timeout = timeout
+        self.max_block = device_limits(host, port, slave_id, max_block)[0]
+        self.lock = threading.Lock()
+        self.values = {kind: {} for kind, _, _ in self.ranges}
+        self.invalid = {kind: set() for kind, _, _ in self.ranges}
+        self.done = set()
+        self.started = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        self.last_save = 0
+        self.active = 0
+        self.stopped = threading.Event()
+        self.resumed = self.load()
+
+    def device(self):
+        return f"{self.host}:{self.port}/{self.slave_id}"
+
+    def load(self):
+        # Fortsetzen nur bei gleichem Geraet, gleichen Bereichen und gleicher Blockgroesse
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except ValueError:
+            return False
+        if (state.get("device") != self.device() or state.get("max_block") != self.max_block
+                or [tuple(r) for r in state.get("ranges", [])] != self.ranges):
+            return False
+        self.started = state.get("started", self.started)
+        self.done = {tuple(c) for c in state.get("done", [])}
+        for kind, found in state.get("values", {}).items():
+            self.values.setdefault(kind, {}).update({int(a, 16): v for a, v in found.items()})
+        for kind, addrs in state.get("invalid", {}).items():
+            self.invalid.setdefault(kind, set()).update(int(a, 16) for a in addrs)
+        return True
+
+    def blocks(self):
+        return [(kind, addr, min(self.max_block, last - addr + 1))
+                for kind, first, last in self.ranges for addr in range(first, last + 1, self.max_block)]
+
+    def save(self, force=False):
+        with self.lock:
+            if not force and time.monotonic() - self.last_save < SAVE_INTERVAL:
+                return
+            self.last_save = time.monotonic()
+            complete = len(self.done) == len(self.blocks())
+            state = {
+                "device": self.device(),
+                "ranges": [list(r) for r in self.ranges],
+                "max_block": self.max_block,
+                "started": self.started,
+                "updated": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+                "complete": complete,
+                "valid": {kind: [[f"0x{lo:04X}", f"0x{hi:04X}"] for lo, hi in to_ranges(found)]
+                          for kind, found in self.values.items()},
+                "values": {kind: {f"0x{a:04X}": v for a, v in sorted(found.items())}
+                           for kind, found in self.values.items()},
+                "invalid": {kind: [f"0x{a:04X}" for a in sorted(addrs)] for kind, addrs in self.invalid.items()},
+                "done": sorted(list(c) for c in self.done),
+            }
+            if complete:
+                state["diff"] = diff_map(self.values, self.ranges)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp, self.path)
+        return state
+
+    def progress(self):
+        with self.lock:
+            total = len(self.blocks())
+            valid = sum(len(v) for v in self.values.values())
+            return f"{len(self.done)}/{total} Bloecke, {valid} gueltige Adressen, {self.active} Verbindung(en)"
+
+    def worker(self, index, work):
+        ctrl = EpeverController(self.host, self.port, self.slave_id, self.max_block, self.timeout)
+        scanned = 0
+        with self.lock:
+            self.active += 1
+        try:
+            while not self.stopped.is_set():
+                try:
+                    block = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    if not ctrl.is_connected() and not ctrl.connect():
+                        raise ConnectionLost
+                    values, invalid = scan_block(ctrl, *block, untested=index > 0 and not scanned)
+                except ConnectionLost:
+                    work.put(block)
+                    # Zusatzverbindung ohne einen einzigen gelesenen Block: Modul erlaubt sie nicht
+                    if index == 0 or scanned:
+                        print(f"Verbindung {index + 1}: Geraet nicht erreichbar, Scan unterbrochen")
+                    return
+                scanned += 1
+                kind = block[0]
+                with self.lock:
+                    self.values[kind].update(values)
+                    self.invalid[kind].update(invalid)
+                    self.done.add(block)
+                self.save()
+        finally:
+            with self.lock:
+                self.active -= 1
+            ctrl.disconnect()
+
+    def run(self, report=None, report_interval=5):
+        work = queue.Queue()
+        for block in self.blocks():
+            if block not in self.done:
+                work.put(block)
+        threads = []
+        last_report = time.monotonic()
+        try:
+            for index in range(self.connections):
+                thread = threading.Thread(target=self.worker, args=(index, work), daemon=True)
+                thread.start()
+                threads.append(thread)
+                # Zusatzverbindungen leicht versetzt, die erste soll sicher zustande kommen
+                time.sleep(0.2)
+            while any(t.is_alive() for t in threads):
+                time.sleep(0.2)
+                if report and time.monotonic() - last_report >= report_interval:
+                    report(self.progress())
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            # Laufende Bloecke noch abschliessen, dann Stand sichern (Fortsetzen beim naechsten Start)
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+        return self.save(force=True)
+
+
+def format_scan(state):
+    lines = [f"Registerscan {state['device']} ({'vollstaendig' if state['complete'] else 'unvollstaendig'})"]
+    for kind, ranges in state["valid"].items():
+        text = ", ".join(lo if lo == hi else f"{lo}-{hi}" for lo, hi in ranges) or "-"
+        lines.append(f"  {kind:9s} {text}")
+    diff = state.get("diff")
+    if diff:
+        lines.append(f"\n  Bekannte Register gefunden: {diff['matched']}")
+        for kind, addrs in diff["unknown"].items():
+            ranges = to_ranges(int(a, 16) for a in addrs)
+            text = ", ".join(f"0x{lo:04X}" if lo == hi else f"0x{lo:04X}-0x{hi:04X}" for lo, hi in ranges)
+            lines.append(f"  Unbekannt ({kind}): {text}")
+        for kind, missing in diff["missing"].items():
+            lines.append(f"  Fehlt ({kind}): {', '.join(f'{a} {sid}' for a, sid in missing.items())}")
+    return "\n".join(lines)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Einstellungs-Profile fuer den Laderegler (z.B. LiFePO4 12 V)
+
+Ein Profil setzt mehrere Einstellungen auf einmal. Beim Anwenden werden die
+aktuellen Holding-Register gelesen, unveraenderte Werte uebersprungen und die
+geaenderten Register zu wenigen write_registers-Bloecken zusammengefasst. Die
+Spannungen 0x9003-0x900C landen so gemeinsam in einem Block und bestehen die
+Plausibilitaetspruefung des Geraets. Danach wird einmal zurueckgelesen und
+pro Register geprueft.
+
+    python epever_controller.py --apply-profile lfp_12v
+
+Eigene Profile: JSON-Datei in SETTINGS_PROFILES (siehe profiles.example.json).
+"""
+
+import os
+import json
+
+from epever_core import (SETTINGS_HOLDINGS, REGISTER_MAP, MAX_BLOCK_SIZE, MAX_BLOCK_GAP, INVALID_REGISTERS,
+                         plan_reads)
+
+SETTINGS_PROFILES = os.environ.get('SETTINGS_PROFILES',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles.json'))
+
+# Eigene Spannungen setzt das Geraet nur im Batterietyp "User"
+PROFILES = {
+    "lfp_12v": {
+        "name": "LiFePO4 12 V (4S)",
+        "values": {
+            "bat_type": "User",
+            "temp_comp": 0,
+            "high_volt_disconnect": 14.8,
+            "charging_limit_volt": 14.4,
+            "over_volt_reconnect": 14.2,
+            "equalize_volt": 14.4,
+            "boost_volt": 14.4,
+            "float_volt": 13.6,
+            "low_volt_disconnect": 11.2,
+            "under_volt_warning": 12.0,
+            "low_volt_reconnect": 12.6,
+            "boost_reconnect_volt": 13.2,
+            "boost_duration": 30,
+            "equalize_duration": 0,
+        },
+    },
+    "lfp_24v": {
+        "name": "LiFePO4 24 V (8S)",
+        "values": {
+            "bat_type": "User",
+            "temp_comp": 0,
+            "high_volt_disconnect": 29.6,
+            "charging_limit_volt": 28.8,
+            "over_volt_reconnect": 28.4,
+            "equalize_volt": 28.8,
+            "boost_volt": 28.8,
+            "float_volt": 27.2,
+            "low_volt_disconnect": 22.4,
+            "under_volt_warning": 24.0,
+            "low_volt_reconnect": 25.2,
+            "boost_reconnect_volt": 26.4,
+            "boost_duration": 30,
+            "equalize_duration": 0,
+        },
+    },
+}
+
+SETTINGS_BY_NAME = {s[1]: s for s in SETTINGS_HOLDINGS}
+# Rohwert je Listenwert, z.B. "Street Light (Dusk-Dawn)" -> 17
+LIST_VALUES = {e[1]: {name: raw for raw, name in e[6].items()} for e in REGISTER_MAP if e[6]}
+
+
+def load_profiles(path=SETTINGS_PROFILES):
+    profiles = dict(PROFILES)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            profiles.update(json.load(f))
+    return profiles
+
+
+def profile_registers(values):
+    """Wandelt {Feld: Wert} in {Adresse: Rohwert} um und prueft die Grenzen"""
+    registers = {}
+    for sid, value in values.items():
+        if sid not in SETTINGS_BY_NAME:
+            raise ValueError(f"Unbekannte Einstellung: {sid}")
+        addr, _, name, unit, factor, vtype, options = SETTINGS_BY_NAME[sid]
+        if addr in INVALID_REGISTERS:
+            raise ValueError(f"{name}: Register 0x{addr:04X} ist ueber das WiFi-Modul nicht erreichbar")
+        if vtype == "list":
+            # Name der Option oder ihr Rohwert (auch als Text, z.B. "17")
+            raw = LIST_VALUES[sid].get(value) if isinstance(value, str) else None
+            if raw is None:
+                try:
+                    raw = int(str(value))
+                except ValueError:
+                    pass
+                if raw not in LIST_VALUES[sid].values():
+                    raise ValueError(f"{name}: ungueltiger Wert {value!r} ({', '.join(options)})")
+        else:
+            try:
+                value = float(value) if isinstance(value, str) else value
+                valid = not isinstance(value, bool) and options[0] <= value <= options[1]
+            except (TypeError, ValueError):
+                raise ValueError(f"{name}: {value!r} ist keine Zahl")
+            if not valid:
+                raise ValueError(f"{name}: {value} {unit or ''} ausserhalb {options[0]}-{options[1]}")
+            raw = int(round(value / factor))
+        registers[addr] = raw
+    return registers
+
+
+def _entries(addrs):
+    return [(addr, f"0x{addr:04X}", "holding", "u16", 1, "settings", None) for addr in sorted(addrs)]
+
+
+def read_registers(ctrl, addrs, max_block=MAX_BLOCK_SIZE):
+    # Rohwerte aller Adressen (inkl. mitgelesener Luecken), mit so wenigen Lesebloecken wie moeglich
+    values = {}
+    for _, start, count, _ in plan_reads(_entries(addrs), max_block):
+        regs = ctrl.read_holding(start, count)
+        if not regs:
+            return None
+        values.update(zip(range(start, start + count), regs))
+    return values
+
+
+def plan_writes(changes, current, max_block=MAX_BLOCK_SIZE, max_gap=MAX_BLOCK_GAP):
+    """Fasst geaenderte Register zu (Startadresse, [Werte]) Bloecken zusammen.
+
+    Luecken zwischen geaenderten Registern werden mit dem aktuellen Wert
+    aufgefuellt, damit zusammengehoerige Spannungen in einem Block landen.
+    """
+    writes = []
+    for _, start, count, _ in plan_reads(_entries(changes), max_block, max_gap):
+        block = [changes.get(addr, current.get(addr)) for addr in range(start, start + count)]
+        if None in block:
+            # Lueckenwert unbekannt: Block an dieser Stelle nicht ueberbruecken
+            for addr in sorted(a for a in changes if start <= a < start + count):
+                if writes and writes[-1][0] + len(writes[-1][1]) == addr:
+                    writes[-1][1].append(changes[addr])
+                else:
+                    writes.append((addr, [changes[addr]]))
+            continue
+        writes.append((start, block))
+    return writes
+
+
+def apply_profile(ctrl, values, max_block=MAX_BLOCK_SIZE):
+    """Schreibt ein Profil und liefert das Ergebnis pro Register"""
+    targets = profile_registers(values)
+    names = {SETTINGS_BY_NAME[sid][0]: sid for sid in values}
+    current = read_registers(ctrl, targets, max_block)
+    if current is None:
+        return {"ok": False, "error": "Aktuelle Einstellungen nicht lesbar"}
+    changes = {addr: raw for addr, raw in targets.items() if current[addr] != raw}
+    writes = plan_writes(changes, current, max_block)
+    failed = set()
+    for start, block in writes:
+        try:
+            ok = ctrl.write_holdings(start, block)
+        except Exception:
+            ok = False
+        if not ok:
+            failed.update(a for a in changes if start <= a < start + len(block))
+    after = read_registers(ctrl, targets, max_block) if changes else current
+    registers = []
+    for addr in sorted(targets):
+        if addr not in changes:
+            status = "unchanged"
+        elif after is None:
+            status = "unverified"
+        elif after[addr] == targets[addr]:
+            status = "written"
+        else:
+            status = "rejected" if addr not in failed else "failed"
+        registers.append({"register": addr, "field": names[addr], "value": targets[addr],
+                          "before": current[addr], "after": after.get(addr) if after else None, "status": status})
+    return {
+        "ok": all(r["status"] in ("unchanged", "written") for r in registers),
+        "changed": len(changes),
+        "transactions": len(writes),
+        "registers": registers,
+    }
+
+
+def format_result(result):
+    if "error" in result:
+        return f"[FEHLER] {result['error']}"
+    lines = []
+    for r in result["registers"]:
+        lines.append(f"  0x{r['register']:04X} {r['field']:24s} {r['before']!s:>6} -> {r['value']!s:>6}  {r['status']}")
+    lines.append(f"{'[OK]' if result['ok'] else '[FEHLER]'} {result['changed']} Register geaendert "
+                 f"in {result['transactions']} Schreibzugriff(en)")
+    return "\n".join(lines)
@@ -6,23 +6,163 @@ EPEVER Web Interface - Flask Application
 import os
 import sys
 import json
+import time
+import queue
+import threading
 from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, render_template, jsonify, request
-from epever_controller import EpeverController, BATTERY_TYPES, LOAD_MODES, CHARGING_STATES
+from flask import Flask, render_template, jsonify, request, Response
+from epever_core import BATTERY_TYPES, LOAD_MODES, CHARGING_STATES
+from epever_poller import subscribe, request as poller_request
+from poll_scheduler import SNAPSHOT_GROUPS
+from history_store import HistoryStore, HISTORY_DB
+from settings_profiles import load_profiles
+from metrics import REGISTRY, CONTENT_TYPE, Histogram
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'epever-secret-key-change-in-production'
 app.config['APPLICATION_ROOT'] = '/epever'
 
-EPEVER_HOST = os.environ.get('EPEVER_HOST', '192.168.178.150')
-EPEVER_PORT = int(os.environ.get('EPEVER_PORT', 8899))
+HTTP_LATENCY = Histogram("epever_http_request_seconds", "Dauer der Web-Anfragen pro Route", ["route", "status"])
 
-def get_controller():
-    ctrl = EpeverController(EPEVER_HOST, EPEVER_PORT)
-    return ctrl
+@app.before_request
+def start_timer():
+    request.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streams (/api/stream, /api/history) nur bis zum Beginn der Antwort
+    rule = request.url_rule.rule if request.url_rule else "unbekannt"
+    HTTP_LATENCY.observe(time.perf_counter() - request.started, route=rule, status=response.status_code)
+    return response
+
+# Daten kommen ausschliesslich vom Poller (epever_poller.py), nie direkt vom Geraet
+SNAPSHOT_MAX_AGE = int(os.environ.get('SNAPSHOT_MAX_AGE', 120))
+
+STREAM_KEEPALIVE = 15
+
+class SnapshotHub:
+    """Ein Abo beim Poller fuer alle Browser, Aenderungen werden einmal berechnet und verteilt"""
+
+    def __init__(self):
+        self.latest = None
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                for snapshot in subscribe(timeout=STREAM_KEEPALIVE * 2):
+                    self.update(snapshot)
+            except (OSError, ValueError):
+                pass
+            if self.latest is not None:
+                self.latest = None
+                self.broadcast("offline", {})
+            time.sleep(2)
+
+    def update(self, snapshot):
+        previous, self.latest = self.latest, snapshot
+        if previous is None:
+            return self.broadcast("snapshot", snapshot)
+        delta = {}
+        for group in SNAPSHOT_GROUPS:
+            changed = {k: v for k, v in snapshot.get(group, {}).items() if previous.get(group, {}).get(k) != v}
+            if changed:
+                delta[group] = changed
+        if snapshot["last_update"] != previous["last_update"]:
+            delta["last_update"] = snapshot["last_update"]
+        if delta:
+            delta["version"] = snapshot.get("version")
+            self.broadcast("delta", delta)
+
+    def broadcast(self, event, payload):
+        message = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        with self.lock:
+            clients = list(self.clients)
+        for q in clients:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Langsamer Client: Stream beenden, der Browser verbindet neu und bekommt den vollen Snapshot
+                self.drop(q)
+
+    def drop(self, q):
+        with self.lock:
+            self.clients.discard(q)
+        while not q.empty():
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        q.put_nowait(None)
+
+    def listen(self):
+        self.start()
+        q = queue.Queue(maxsize=10)
+        with self.lock:
+            self.clients.add(q)
+        try:
+            if self.latest is not None:
+                yield f"event: snapshot\ndata: {json.dumps(self.latest)}\n\n"
+            while True:
+                try:
+                    message = q.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            with self.lock:
+                self.clients.discard(q)
+
+hub = SnapshotHub()
+
+def parse_time(value, default):
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def snapshot_response(group=None):
+    # Snapshot mit Version als ETag; If-None-Match -> 304, ?since=<version> und ?fields=a,b filtern
+    params = {}
+    if request.args.get('since'):
+        try:
+            params["since"] = int(request.args['since'])
+        except ValueError:
+            return jsonify({"error": "Ungueltige Version"}), 400
+    etags = request.if_none_match.as_set(include_weak=True)
+    if len(etags) == 1 and next(iter(etags)).isdigit():
+        params["known"] = int(next(iter(etags)))
+    if request.args.get('fields'):
+        params["fields"] = request.args['fields'].split(',')
+    try:
+        resp = poller_request("get", **params)
+    except (OSError, ValueError):
+        resp = None
+    if not resp or not resp.get("ok") or resp.get("age", 0) > SNAPSHOT_MAX_AGE:
+        return jsonify({"error": "Keine Verbindung zum EPEVER"}), 500
+    if "data" not in resp:
+        response = Response(status=304)
+    else:
+        response = jsonify(resp["data"] if group is None else resp["data"][group])
+    response.set_etag(str(resp["version"]))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/')
 def index():
@@ -30,62 +170,92 @@ def index():
 
 @app.route('/api/data')
 def api_data():
-    ctrl = get_controller()
-    if not ctrl.connect():
-        return jsonify({"error": "Keine Verbindung zum EPEVER"}), 500
-    try:
-        data = ctrl.get_all_data()
-        return jsonify(data)
-    finally:
-        ctrl.disconnect()
+    return snapshot_response()
 
 @app.route('/api/realtime')
 def api_realtime():
-    ctrl = get_controller()
-    if not ctrl.connect():
-        return jsonify({"error": "Keine Verbindung"}), 500
-    try:
-        return jsonify(ctrl.get_realtime_data())
-    finally:
-        ctrl.disconnect()
+    return snapshot_response("realtime")
 
 @app.route('/api/statistics')
 def api_statistics():
-    ctrl = get_controller()
-    if not ctrl.connect():
-        return jsonify({"error": "Keine Verbindung"}), 500
-    try:
-        return jsonify(ctrl.get_statistics())
-    finally:
-        ctrl.disconnect()
+    return snapshot_response("statistics")
 
 @app.route('/api/settings')
 def api_settings():
-    ctrl = get_controller()
-    if not ctrl.connect():
-        return jsonify({"error": "Keine Verbindung"}), 500
-    try:
-        return jsonify(ctrl.get_settings())
-    finally:
-        ctrl.disconnect()
+    return snapshot_response("settings")
+
+@app.route('/api/stream')
+def api_stream():
+    return Response(hub.listen(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/settings/<int:register>', methods=['POST'])
 def api_set_setting(register):
-    ctrl = get_controller()
-    if not ctrl.connect():
-        return jsonify({"error": "Keine Verbindung"}), 500
+    data = request.get_json()
+    value = data.get('value')
+    if value is None:
+        return jsonify({"error": "Kein Wert angegeben"}), 400
+
+    try:
+        result = poller_request("set", register=register, value=int(value))
+    except OSError:
+        return jsonify({"error": "Poller nicht erreichbar"}), 500
+    if result.get("ok"):
+        return jsonify({"success": True, "register": register, "value": value})
+    return jsonify({"error": result.get("error", "Schreiben fehlgeschlagen")}), 500
+
+@app.route('/api/profiles')
+def api_profiles():
+    return jsonify(load_profiles())
+
+@app.route('/api/profiles/<name>', methods=['POST'])
+def api_apply_profile(name):
+    if name not in load_profiles():
+        return jsonify({"error": f"Unbekanntes Profil: {name}"}), 404
+    try:
+        result = poller_request("apply_profile", profile=name, timeout=30)
+    except OSError:
+        return jsonify({"error": "Poller nicht erreichbar"}), 500
+    return jsonify(result), 200 if result.get("ok") else 500
+
+@app.route('/api/history')
+def api_history():
+    field = request.args.get('field')
+    if not field:
+        return jsonify({"error": "Kein Feld angegeben"}), 400
+    if not os.path.exists(HISTORY_DB):
+        return jsonify({"error": "Keine Historie vorhanden"}), 404
+    try:
+        end = parse_time(request.args.get('to'), time.time())
+        start = parse_time(request.args.get('from'), end - 86400)
+        step = int(request.args.get('step', 0)) or max(1, int((end - start) / 500))
+    except ValueError:
+        return jsonify({"error": "Ungueltiger Zeitraum"}), 400
+
+    def generate():
+        # Eigene Verbindung pro Anfrage, die Antwort wird zeilenweise gestreamt
+        history = HistoryStore(HISTORY_DB, readonly=True)
+        try:
+            # Tatsaechliche Schrittweite: aeltere Zeitraeume gibt es nur noch in groeberen Stufen
+            _, _, actual = history.resolve(start, step)
+            yield f'{{"field": {json.dumps(field)}, "step": {actual}, "points": ['
+            for i, (ts, vmin, vmax, vavg) in enumerate(history.query(field, start, end, step)):
+                yield ("," if i else "") + json.dumps([ts, round(vmin, 3), round(vmax, 3), round(vavg, 3)])
+            yield ']}'
+        finally:
+            history.close()
+
+    return Response(generate(), mimetype='application/json')
+
+@app.route('/metrics')
+def metrics():
+    # Eigene Metriken plus die des Pollers (Modbus, Zyklen, Verbindung)
+    text = REGISTRY.render()
     try:
-        data = request.get_json()
-        value = data.get('value')
-        if value is None:
-            return jsonify({"error": "Kein Wert angegeben"}), 400
-        
-        if ctrl.set_setting(register, int(value)):
-            return jsonify({"success": True, "register": register, "value": value})
-        else:
-            return jsonify({"error": "Schreiben fehlgeschlagen"}), 500
-    finally:
-        ctrl.disconnect()
+        text += poller_request("metrics").get("text", "")
+    except (OSError, ValueError):
+        pass
+    return Response(text, content_type=CONTENT_TYPE)
 
 @app.route('/api/battery-types')
 def api_battery_types():